@@ -19,7 +19,7 @@ from robot_and_initial_state import (
     ROBOT_CONFIG,
     SIMULATION_CONFIG
 )
-from strategy_config import ROUTING_STRATEGY
+from strategy_config import ROUTING_STRATEGY, PICKS_COST_MAP_KEYS
 from charging_config import CHARGING_STRATEGY, CHARGING_STATION_CONFIG 
 from taskmanager import TaskManager
 from congestion_model import CongestionManager
@@ -27,7 +27,6 @@ from visualization import Visualizer
 from performance_logger import PerformanceLogger
 
 Coord = Tuple[int, int]
-Task = Dict[str, any]
 
 # --- 靜態匯入通用函式 ---
 # 從基礎路徑規劃模組匯入通用函式，避免每個策略模組都重複定義
@@ -73,7 +72,8 @@ class SimulationEngine:
         self.congestion_manager = CongestionManager()
         self.visualize = visualize
         if self.visualize:
-            self.visualizer = Visualizer(self.warehouse_matrix, list(self.robots.values()))
+            self.visualizer = Visualizer(self.warehouse_matrix, list(self.robots.values()),
+                                         draw_every=SIMULATION_CONFIG.get("draw_every", 1))
         self.performance_logger = PerformanceLogger()
 
         # --- Get station locations for routing ---
@@ -87,6 +87,10 @@ class SimulationEngine:
         # 為了方便處理出口邏輯
         self.picking_exits = {s['pos']: s['exit'] for s in self.picking_stations_info}
         self.charge_exits = {s['pos']: s['exit'] for s in self.charge_stations_info}
+        # 依站點座標查找站點資訊；站點在模擬期間不變，建一次即可取代每次的線性搜尋
+        self.picking_station_by_pos = {s['pos']: s for s in self.picking_stations_info}
+        self.charge_station_by_pos = {s['pos']: s for s in self.charge_stations_info}
+        self.station_by_pos = {**self.charge_station_by_pos, **self.picking_station_by_pos}
 
         # 建立一個包含所有排隊區格子的集合，用於快速查找
         self.all_queue_spots = set()
@@ -193,8 +197,8 @@ class SimulationEngine:
         if robot.status == RobotStatus.MOVING_TO_SHELF:
             forbidden_cells = self.all_queue_spots
         elif robot.status in [RobotStatus.MOVING_TO_DROPOFF, RobotStatus.MOVING_TO_CHARGE]:
-            station_list = self.picking_stations_info if robot.status == RobotStatus.MOVING_TO_DROPOFF else self.charge_stations_info
-            station_info = next((s for s in station_list if s['pos'] == robot.target_station_pos), None)
+            station_by_pos = self.picking_station_by_pos if robot.status == RobotStatus.MOVING_TO_DROPOFF else self.charge_station_by_pos
+            station_info = station_by_pos.get(robot.target_station_pos)
 
             if station_info:
                 entry_point = station_info['queue'][-1]
@@ -224,17 +228,17 @@ class SimulationEngine:
                 if energy_consumed > 0:
                     self.performance_logger.log_energy_usage(robot.id, energy_consumed)
 
-                completed_shelf = robot.task['shelf_locations'].pop(0)
+                completed_shelf = robot.task.shelf_locations.pop(0)
                 print(f" 機器人 {robot.id} 在 {completed_shelf} 完成撿貨。")
 
-                if robot.task['shelf_locations']:
+                if robot.task.shelf_locations:
                     self._plan_path_to_next_shelf(robot, completed_shelf)
                 else:
                     self._plan_path_to_dropoff(robot, completed_shelf)
 
         elif robot.status == RobotStatus.DROPPING_OFF:
             if robot.drop_off_item():
-                print(f" 機器人 {robot.id} 完成任務 {robot.task['task_id']} 的交貨。")
+                print(f" 機器人 {robot.id} 完成任務 {robot.task.task_id} 的交貨。")
                 self.performance_logger.log_task_completion(time_step)
                 exit_pos = self.picking_exits.get(robot.position)
                 if exit_pos:
@@ -248,12 +252,14 @@ class SimulationEngine:
     def _update_queueing_robot(self, robot: Robot, spots_targeted_in_queue_logic: set):
         """處理在隊列中等待的機器人。"""
         target_station_pos = robot.target_station_pos
-        station_info = next((s for s in self.picking_stations_info + self.charge_stations_info if s['pos'] == target_station_pos), None)
+        station_info = self.station_by_pos.get(target_station_pos)
 
         if not station_info:
             print(f"錯誤：機器人 {robot.id} 正在排隊，但找不到其目標站點 {target_station_pos}！")
             robot.clear_task()
             return
+        # 站點類型直接由充電站查找表判斷，不再對站點 id 做字串搜尋
+        is_charge_station = self.charge_station_by_pos.get(target_station_pos) is station_info
 
         try:
             current_queue_index = station_info['queue'].index(robot.position)
@@ -272,7 +278,7 @@ class SimulationEngine:
         # 如果要進入的是站點本身，檢查站點是否可用
         if next_spot_in_line == station_info['pos']:
             station_is_available = False
-            if "CS" in station_info['id']:
+            if is_charge_station:
                 if len(self.charging_station.charging) < self.charging_station.capacity:
                     station_is_available = True
             else:
@@ -286,7 +292,7 @@ class SimulationEngine:
         if path_to_next_spot:
             print(f" 機器人 {robot.id} 從 {robot.position} 向前移動至 {next_spot_in_line}")
             robot.path = path_to_next_spot
-            robot.status = RobotStatus.MOVING_TO_CHARGE if "CS" in station_info['id'] else RobotStatus.MOVING_TO_DROPOFF
+            robot.status = RobotStatus.MOVING_TO_CHARGE if is_charge_station else RobotStatus.MOVING_TO_DROPOFF
             spots_targeted_in_queue_logic.add(next_spot_in_line)
         else:
             print(f" 機器人 {robot.id} 在隊列中找不到前往下一格 {next_spot_in_line} 的路徑！")
@@ -319,8 +325,8 @@ class SimulationEngine:
 
     def _plan_path_to_next_shelf(self, robot: Robot, completed_shelf: Coord):
         """規劃路徑到任務中的下一個貨架。"""
-        next_shelf = robot.task['shelf_locations'][0]
-        print(f"...任務 {robot.task['task_id']} 未完成，機器人 {robot.id} 前往下一站: {next_shelf}")
+        next_shelf = robot.task.shelf_locations[0]
+        print(f"...任務 {robot.task.task_id} 未完成，機器人 {robot.id} 前往下一站: {next_shelf}")
 
         start_pos_for_route = find_adjacent_aisle(robot.position, self.warehouse_matrix)
         if not start_pos_for_route:
@@ -330,16 +336,10 @@ class SimulationEngine:
 
         # 【修正】為後續路徑規劃準備 cost_map，以確保複雜策略能持續運作
         cost_map = {}
-        if robot.task and len(robot.task.get('shelf_locations', [])) > 0:
-            strategy_key_map = {
-                'routing_m': 'composite_picks',
-                'routing_l': 'largest_gap_picks',
-                'routing_s': 's_shape_picks'
-            }
-            routing_strategy_name = ROUTING_STRATEGY
-            if routing_strategy_name in strategy_key_map:
-                key = strategy_key_map[routing_strategy_name]
-                cost_map[key] = robot.task['shelf_locations']
+        if robot.task and robot.task.shelf_locations:
+            key = PICKS_COST_MAP_KEYS.get(ROUTING_STRATEGY)
+            if key is not None:
+                cost_map[key] = robot.task.shelf_locations
 
         path = plan_route(start_pos_for_route, next_shelf, self.warehouse_matrix, cost_map=cost_map)
         if path:
@@ -348,16 +348,16 @@ class SimulationEngine:
             robot.status = RobotStatus.MOVING_TO_SHELF
         else:
             print(f" 機器人 {robot.id} 在 {start_pos_for_route} 找不到前往下一個貨架 {next_shelf} 的路徑！將在原地等待。")
-            robot.task['shelf_locations'].insert(0, completed_shelf)
+            robot.task.shelf_locations.insert(0, completed_shelf)
 
     def _plan_path_to_dropoff(self, robot: Robot, completed_shelf: Coord):
         """在所有撿貨點完成後，規劃路徑到交貨站排隊入口（只能從最遠那格進入）"""
-        print(f" 機器人 {robot.id} 完成任務 {robot.task['task_id']} 的所有撿貨點。")
+        print(f" 機器人 {robot.id} 完成任務 {robot.task.task_id} 的所有撿貨點。")
         best_station, best_queue_spot, _ = self._find_closest_available_station(robot.position, self.picking_stations_info)
         
         if not (best_station and best_queue_spot):
             print(f" 機器人 {robot.id} 撿貨完畢，但所有交貨站入口忙碌中，將在原地等待。")
-            robot.task['shelf_locations'].insert(0, completed_shelf)
+            robot.task.shelf_locations.insert(0, completed_shelf)
             return
         
         # 嚴格限制：只能從最遠的入口進入，其他所有排隊格都禁止
@@ -371,7 +371,7 @@ class SimulationEngine:
             robot.set_path_to_dropoff(path, best_station['pos'])
         else:
             print(f" 機器人 {robot.id} 在 {start_pos_for_route} 找不到前往排隊區入口 {best_queue_spot} 的路徑！將在原地等待。")
-            robot.task['shelf_locations'].insert(0, completed_shelf)
+            robot.task.shelf_locations.insert(0, completed_shelf)
 
     def _update_robot_state(self, robot: Robot, approved_ids: set, spots_targeted: set, time_step: int):
         """根據機器人當前狀態，分派給對應的處理函式。"""
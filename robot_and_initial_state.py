@@ -1,7 +1,10 @@
 import random
 import numpy as np
 from enum import Enum
-from typing import Tuple, Optional, Dict, List, Union
+from typing import Tuple, Optional, Dict, List, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from taskmanager import Task
 
 # --- 參數設定區 ---
 
@@ -24,6 +27,7 @@ SIMULATION_CONFIG = {
     "max_simulation_steps_safety_limit": 50000, # 為防止無限迴圈，設定一個極大的安全步數上限
     "task_generation_interval": 1, # 每 n 個時間步生成一個新任務 (調快以確保有足夠任務)
     "task_locations_range": (1, 3), # 每個任務包含的貨架地點數量的隨機範圍 (最小值, 最大值)
+    "draw_every": 1, # 視覺化每隔幾個時間步重繪一次 (1 表示每一步都繪製)
 }
 
 Coord = Tuple[int, int]
@@ -62,7 +66,7 @@ class Robot:
         # 基本屬性 / 狀態
         self.id = robot_id
         self.position = initial_position
-        self.task: Optional[Dict] = None
+        self.task: Optional['Task'] = None
         self.status: RobotStatus = RobotStatus.IDLE
         
         # 搬運作業相關屬性
@@ -99,14 +103,14 @@ class Robot:
         return (f"Robot(id={self.id}, pos={self.position}, "
                 f"status='{self.status.value}', battery={self.battery_level})")
 
-    def assign_task(self, task: Dict, path: List[Coord]):
+    def assign_task(self, task: 'Task', path: List[Coord]):
         """為機器人指派新任務與路徑。"""
         if self.status != RobotStatus.IDLE:
             raise RuntimeError(f"無法指派任務給狀態為 '{self.status.value}' 的機器人 {self.id}")
         self.task = task
         self.path = path
         self.status = RobotStatus.MOVING_TO_SHELF
-        print(f"任務 {task.get('task_id')} 已指派給 {self.id}")
+        print(f"任務 {task.task_id} 已指派給 {self.id}")
 
     def move_to_next_step(self) -> int:
         """
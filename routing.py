@@ -35,7 +35,7 @@ def find_adjacent_aisle(pos: Coord, warehouse_matrix: np.ndarray) -> Optional[Co
     return None
 
 
-def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optional[List[Coord]] = None, forbidden_cells: Optional[Set[Coord]] = None, cost_map: Optional[Dict[Coord, int]] = None):
+def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optional[List[Coord]] = None, forbidden_cells: Optional[Set[Coord]] = None, cost_map: Optional[Dict[Coord, int]] = None, bounds: Optional[Tuple[int, int, int, int]] = None):
     """【核心策略函式】
     為機器人規劃一條從起點到終點的路徑。
     
@@ -45,6 +45,7 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     - `dynamic_obstacles`: 其他機器人目前的位置。您的演算法應避免路徑經過這些點。
     - `forbidden_cells`: 此次規劃中「絕對不能」經過的格子。這由主引擎根據機器人當前任務決定。
     - `cost_map`: 一個「建議」繞行的區域地圖。移動到這些格子的成本較高，您的演算法可以利用此資訊找出更有效率或更安全的路線，但並非強制禁止。
+    - `bounds`: (選用) 搜尋範圍 `(r_min, r_max, c_min, c_max)`，超出此矩形的格子不會被展開。
 
     **你的演算法需要提供什麼結果 (回傳值)：**
     - 一個座標列表 `List[Coord]`：代表從「下一步」到終點的路徑。
@@ -70,12 +71,22 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     if cost_map is None:
         cost_map = {}
 
+    # 搜尋範圍：未指定時為整張地圖，並裁切到地圖邊界內
+    if bounds is None:
+        r_min, r_max, c_min, c_max = 0, rows - 1, 0, cols - 1
+    else:
+        r_min, r_max = max(0, bounds[0]), min(rows - 1, bounds[1])
+        c_min, c_max = max(0, bounds[2]), min(cols - 1, bounds[3])
+
+    # 佈局攤平成一維 Python 列表 (索引為 r * cols + c)，展開節點時省去 NumPy 逐格索引的開銷
+    layout = warehouse_matrix.ravel().tolist()
+
     def neighbors(pos: Coord) -> List[Coord]:
         r, c = pos
         candidates = [(r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)] # 四個方向
         valid_neighbors = []
         for nr, nc in candidates:
-            if 0 <= nr < rows and 0 <= nc < cols:
+            if r_min <= nr <= r_max and c_min <= nc <= c_max:
                 # 檢查動態障礙物 (除非它是我們的最終目標)
                 if dynamic_obstacles and (nr, nc) in dynamic_obstacles and (nr, nc) != target_pos:
                     continue
@@ -85,7 +96,7 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
                     continue
 
                 # 檢查靜態倉庫佈局。所有非障礙物的格子都是可通行的。
-                cell_type = warehouse_matrix[nr, nc]
+                cell_type = layout[nr * cols + nc]
                 if cell_type in [0, 4, 5, 6, 7] or (nr, nc) == target_pos:
                     valid_neighbors.append((nr, nc))
         return valid_neighbors
@@ -259,6 +259,8 @@ def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray
         return [start]
     
     rows, cols = warehouse_matrix.shape
+    # 佈局攤平成一維 Python 列表 (索引為 r * cols + c)，展開節點時省去 NumPy 逐格索引的開銷
+    layout = warehouse_matrix.ravel().tolist()
     
     def neighbors(pos: Coord) -> List[Coord]:
         r, c = pos
@@ -273,7 +275,7 @@ def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray
                 if (nr, nc) in forbidden_cells and (nr, nc) != goal:
                     continue
                 # 檢查倉庫佈局
-                cell_type = warehouse_matrix[nr, nc]
+                cell_type = layout[nr * cols + nc]
                 if cell_type in [0, 4, 5, 6, 7] or (nr, nc) == goal:
                     valid.append((nr, nc))
         return valid
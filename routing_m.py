@@ -38,18 +38,24 @@
    - 輸出: 從「下一步」到終點的路徑列表，例如：[(0,1), (0,2), (1,2)]
 """
 
+import bisect
+import functools
 import heapq
+import itertools
 import math
 from typing import List, Tuple, Optional, Set, Dict
 import numpy as np
 from warehouse_layout import (
-    is_turn_point, find_nearest_turn_point
+    is_turn_point, find_nearest_turn_point, find_nearest_turn_points
 )
 from routing import plan_route as plan_route_a_star # 匯入基礎 A* 演算法並重新命名
 
 # --- 型別別名，方便閱讀 ---
 Coord = Tuple[int, int]
 
+# 內部 A* 搜尋範圍在起終點外接矩形外再擴張的格數，保留繞過貨架的空間
+BOUNDS_MARGIN = 3
+
 def euclidean_distance(pos1: Coord, pos2: Coord) -> float:
     """【輔助函式】計算兩點之間的歐幾里得距離。"""
     return math.sqrt((pos1[0] - pos2[0])**2 + (pos1[1] - pos2[1])**2)
@@ -75,15 +81,42 @@ def find_adjacent_aisle(pos: Coord, warehouse_matrix: np.ndarray) -> Optional[Co
             return (nr, nc)
     return None
 
+@functools.lru_cache(maxsize=64)
+def _station_array(stations: Tuple[Coord, ...]) -> np.ndarray:
+    """站點座標的 (N, 2) int32 陣列，相同站點組合只建立一次。"""
+    return np.asarray(stations, dtype=np.int32).reshape(-1, 2)
+
 def nearest_station(curr: Coord, stations: List[Coord]) -> Coord:
-    """找到最近的站點"""
-    return min(stations, key=lambda s: manhattan_distance(curr, s))
+    """找到最近的站點 (曼哈頓距離，同距離時取列表中較前者)"""
+    arr = _station_array(tuple(map(tuple, stations)))
+    dist = np.abs(arr[:, 0] - curr[0]) + np.abs(arr[:, 1] - curr[1])
+    return stations[int(np.argmin(dist))]
+
+@functools.lru_cache(maxsize=1024)
+def _aisle_exits(col: int, rows: int) -> Tuple[Coord, Coord]:
+    """巷道上、下出口的轉彎點，佈局固定，依 (巷道, 列數) 只計算一次。"""
+    return (find_nearest_turn_point((0, col), 'any'),
+            find_nearest_turn_point((rows - 1, col), 'any'))
+
+@functools.lru_cache(maxsize=8)
+def _turn_point_table(rows: int, cols: int) -> Tuple[Tuple[Coord, ...], ...]:
+    """每一格最近的轉彎點查找表，依地圖尺寸建立一次；之後 table[r][c] 即可 O(1) 取得。"""
+    cells = np.indices((rows, cols)).reshape(2, -1).T
+    nearest = [tuple(tp) for tp in find_nearest_turn_points(cells).tolist()]
+    return tuple(tuple(nearest[r * cols:(r + 1) * cols]) for r in range(rows))
+
+def nearest_turn_point(pos: Coord, warehouse_matrix: np.ndarray) -> Coord:
+    """與 find_nearest_turn_point(pos) 相同，地圖範圍內改查預先建好的表。"""
+    rows, cols = warehouse_matrix.shape
+    r, c = pos
+    if 0 <= r < rows and 0 <= c < cols:
+        return _turn_point_table(rows, cols)[r][c]
+    return find_nearest_turn_point(pos)
 
 def pick_exit_based_on_next(curr: Coord, col: int, warehouse_matrix: np.ndarray, next_target: Coord) -> Coord:
     """出口選擇：根據下一目標方向選擇最佳出口"""
     # 找到該列的上下轉彎點
-    turn_up = find_nearest_turn_point((0, col), 'any')   # 上出口
-    turn_down = find_nearest_turn_point((warehouse_matrix.shape[0]-1, col), 'any') # 下出口
+    turn_up, turn_down = _aisle_exits(col, warehouse_matrix.shape[0])
     
     if turn_up and turn_down:
         # 選擇距離下一目標較近的出口
@@ -125,9 +158,6 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     4. 如果不適用混合策略，回退到標準 A* 演算法
     ---
     """
-    # 調試信息：記錄路徑規劃的參數
-    print(f"🗺️ 混合策略路徑規劃: {start_pos} -> {target_pos}")
-    
     # 初始化參數
     if forbidden_cells is None:
         forbidden_cells = set()
@@ -136,6 +166,13 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     if dynamic_obstacles is None:
         dynamic_obstacles = []
 
+    return _plan_route_impl(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
+
+def _plan_route_impl(start_pos: Coord, target_pos: Coord, warehouse_matrix: np.ndarray, dynamic_obstacles, forbidden_cells, cost_map: Dict) -> Optional[List[Coord]]:
+    """plan_route 的主體，參數須已正規化 (不得為 None)。"""
+    # 調試信息：記錄路徑規劃的參數
+    print(f"🗺️ 混合策略路徑規劃: {start_pos} -> {target_pos}")
+
     # 檢查是否使用混合策略
     if 'composite_picks' in cost_map and len(cost_map['composite_picks']) > 1:
         pick_locations = cost_map['composite_picks']
@@ -198,6 +235,7 @@ def clear_composite_cache():
     """清除所有混合策略快取"""
     global _composite_cache
     _composite_cache = {}
+    _internal_path_cached.cache_clear()
 
 def plan_composite_complete_route(start_pos: Coord, pick_locations: List[Coord], warehouse_matrix: np.ndarray, dynamic_obstacles: List[Coord], forbidden_cells: Set[Coord], cost_map: Dict) -> List[Coord]:
     """
@@ -221,10 +259,40 @@ def plan_composite_complete_route(start_pos: Coord, pick_locations: List[Coord],
     if not pick_locations:
         return [start_pos]
     
-    remaining = pick_locations.copy()
-    path = [start_pos]
+    # 剩餘撿貨點 -> 尚需撿取次數；dict 保持原始順序且移除為 O(1)，取代 list.remove 的線性搜尋
+    remaining: Dict[Coord, int] = {}
+    for p in pick_locations:
+        remaining[p] = remaining.get(p, 0) + 1
+    path = [start_pos]  # 各路徑段以 islice 跳過段首 (即目前位置) 接回，不建立 segment[1:] 切片
     curr = start_pos
     neighbor_threshold = cost_map.get('neighbor_threshold', 2)
+
+    # 依巷道 (列) 分組並按 row 排序的剩餘撿貨點，撿完時同步移除，避免每輪重新過濾與排序
+    col_to_sorted: Dict[int, List[Coord]] = {}
+    for p in pick_locations:
+        bisect.insort(col_to_sorted.setdefault(p[1], []), p)
+
+    def take(p: Coord):
+        """自剩餘撿貨點與巷道索引中各移除一次 p；巷道清空時一併刪除，之後不會再被檢視。"""
+        if remaining[p] == 1:
+            del remaining[p]
+        else:
+            remaining[p] -= 1
+        aisle = col_to_sorted[p[1]]
+        del aisle[bisect.bisect_left(aisle, p)]
+        if not aisle:
+            del col_to_sorted[p[1]]
+
+    # 地圖與障礙物的快取鍵只在規劃開始時轉換一次；路徑段直接取用快取中的 tuple，不另行複製
+    grid_key = (warehouse_matrix.tobytes(), warehouse_matrix.shape, warehouse_matrix.dtype.str)
+    dyn_frozen = dynamic_obstacles if isinstance(dynamic_obstacles, frozenset) else frozenset(dynamic_obstacles or ())
+    forb_frozen = forbidden_cells if isinstance(forbidden_cells, frozenset) else frozenset(forbidden_cells or ())
+
+    def segment_between(a: Coord, b: Coord) -> Tuple[Coord, ...]:
+        """與 a_star_internal_path 相同 (含起點，找不到時為空)，但返回快取的 tuple。"""
+        if a == b:
+            return (a,)
+        return _internal_path_cached(a, b, *grid_key, dyn_frozen, forb_frozen)
     
     print(f" 開始混合策略路徑計算，起點: {start_pos}，撿貨點: {pick_locations}")
     
@@ -236,68 +304,69 @@ def plan_composite_complete_route(start_pos: Coord, pick_locations: List[Coord],
         
         # 2. 如果不在 turn point，先移動到最近的 turn point
         if not is_turn_point(curr):
-            turn_point = find_nearest_turn_point(curr)
+            turn_point = nearest_turn_point(curr, warehouse_matrix)
             if turn_point and turn_point != curr:
                 print(f"  → 移動到轉彎點: {turn_point}")
-                segment = a_star_internal_path(curr, turn_point, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                segment = segment_between(curr, turn_point)
                 if segment:
                     if len(segment) > 1:
-                        path.extend(segment[1:])
+                        path.extend(itertools.islice(segment, 1, None))
                     curr = turn_point
         
         # 3. 水平移動到目標 sub road 所在列
         if curr[1] != tc:
             horizontal_target = (curr[0], tc)
             print(f"  → 水平移動到: {horizontal_target}")
-            segment = a_star_internal_path(curr, horizontal_target, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+            segment = segment_between(curr, horizontal_target)
             if segment:
                 if len(segment) > 1:
-                    path.extend(segment[1:])
+                    path.extend(itertools.islice(segment, 1, None))
                 curr = horizontal_target
         
         # 4. 分析巷道內貨物並決定撿取策略
-        aisle_orders = sorted([p for p in remaining if p[1] == tc], key=lambda p: p[0])
+        aisle_orders = list(col_to_sorted.get(tc, ()))
         picked_now = []
         
         if len(aisle_orders) >= 2:
             # 判斷距離分布
-            col_range = max(aisle_orders, key=lambda p: p[0])[0] - min(aisle_orders, key=lambda p: p[0])[0]
+            col_range = aisle_orders[-1][0] - aisle_orders[0][0]  # aisle_orders 已依 row 排序
             
             if col_range <= neighbor_threshold:
                 # 緊鄰策略：一次撿完
                 print(f"  🎯 緊鄰策略：一次撿完 {len(aisle_orders)} 個貨物，範圍: {col_range}")
                 seq = aisle_orders if curr[0] <= aisle_orders[0][0] else list(reversed(aisle_orders))
                 for pick_pos in seq:
-                    segment = a_star_internal_path(curr, pick_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                    segment = segment_between(curr, pick_pos)
                     if segment:
                         if len(segment) > 1:
-                            path.extend(segment[1:])
+                            path.extend(itertools.islice(segment, 1, None))
                         curr = pick_pos
-                        picked_now.apend(curr)
+                        picked_now.append(curr)
                         print(f"     撿貨完成: {curr}")
             elif len(aisle_orders) >= 3:
                 # 完整穿越策略
                 print(f"   完整穿越策略：撿完 {len(aisle_orders)} 個貨物")
                 seq = aisle_orders if curr[0] <= aisle_orders[0][0] else list(reversed(aisle_orders))
                 for pick_pos in seq:
-                    segment = a_star_internal_path(curr, pick_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                    segment = segment_between(curr, pick_pos)
                     if segment:
                         if len(segment) > 1:
-                            path.extend(segment[1:])
+                            path.extend(itertools.islice(segment, 1, None))
                         curr = pick_pos
                         picked_now.append(curr)
                         print(f"     撿貨完成: {curr}")
                 
                 # 選擇最佳出口（基於下一目標）
-                remaining_after_picks = [p for p in remaining if p not in aisle_orders]
+                # col_to_sorted 與 remaining 同步，不在本巷道的撿貨點即為列號不同者
+                remaining_after_picks = [p for p in remaining if p[1] != tc]
                 if remaining_after_picks:
                     next_target = min(remaining_after_picks, key=lambda p: manhattan_distance(curr, p))
                     exit_turn = pick_exit_based_on_next(curr, tc, warehouse_matrix, next_target)
                     print(f"  → 基於下一目標 {next_target}，選擇出口: {exit_turn}")
-                    segment = a_star_internal_path(curr, exit_turn, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                    segment = segment_between(curr, exit_turn)
                     if segment:
                         if len(segment) > 1:
-                            path.extend(segment[1:])
+                            path.extend(itertools.islice(segment, 1, None))
                         curr = exit_turn
             else:
                 # 入口側策略
@@ -306,67 +375,80 @@ def plan_composite_complete_route(start_pos: Coord, pick_locations: List[Coord],
                 # 決定撿貨順序
                 seq = aisle_orders if curr[0] <= aisle_orders[0][0] else list(reversed(aisle_orders))
                 for pick_pos in seq:
-                    segment = a_star_internal_path(curr, pick_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                    segment = segment_between(curr, pick_pos)
                     if segment:
                         if len(segment) > 1:
-                            path.extend(segment[1:])
+                            path.extend(itertools.islice(segment, 1, None))
                         curr = pick_pos
                         picked_now.append(curr)
                         print(f"     撿貨完成: {curr}")
                 
                 # 撿完該巷道的所有目標後，再返回入口轉彎點
-                entry_turn = find_nearest_turn_point(curr)
+                entry_turn = nearest_turn_point(curr, warehouse_matrix)
                 if entry_turn and entry_turn != curr:
-                    segment = a_star_internal_path(curr, entry_turn, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                    segment = segment_between(curr, entry_turn)
                     if segment:
                         if len(segment) > 1:
-                            path.extend(segment[1:])
+                            path.extend(itertools.islice(segment, 1, None))
                         curr = entry_turn
         else:
             # 單一貨物
             print(f"   單一貨物策略")
             pick_pos = aisle_orders[0]
-            segment = a_star_internal_path(curr, pick_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+            segment = segment_between(curr, pick_pos)
             if segment and len(segment) > 1:
-                path.extend(segment[1:])
+                path.extend(itertools.islice(segment, 1, None))
                 curr = pick_pos
                 picked_now.append(curr)
                 print(f"     撿貨完成: {curr}")
             
             # 返回入口轉彎點
-            entry_turn = find_nearest_turn_point(curr)
+            entry_turn = nearest_turn_point(curr, warehouse_matrix)
             if entry_turn and entry_turn != curr:
-                segment = a_star_internal_path(curr, entry_turn, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                segment = segment_between(curr, entry_turn)
                 if segment:
                     if len(segment) > 1:
-                        path.extend(segment[1:])
+                        path.extend(itertools.islice(segment, 1, None))
                     curr = entry_turn
         
         # 移除已完成的貨物
         for p in picked_now:
             if p in remaining:
-                remaining.remove(p)
+                take(p)
         
         # 5. 順路檢查：返程時檢查主幹道附近的貨物
-        nearby_picks = []
-        for p in remaining[:]:
-            if manhattan_distance(curr, p) <= neighbor_threshold:
-                nearby_picks.append(p)
+        nearby_picks = [p for p, count in remaining.items()
+                        if manhattan_distance(curr, p) <= neighbor_threshold for _ in range(count)]
         
         if nearby_picks:
             print(f"  🛤️ 順路檢查：發現 {len(nearby_picks)} 個附近貨物")
             for p in nearby_picks:
-                segment = a_star_internal_path(curr, p, warehouse_matrix, dynamic_obstacles, forbidden_cells)
+                segment = segment_between(curr, p)
                 if segment:
                     if len(segment) > 1:
-                        path.extend(segment[1:])
+                        path.extend(itertools.islice(segment, 1, None))
                     curr = p
-                    remaining.remove(p)
+                    take(p)
                     print(f"     順路撿貨: {p}")
     
     print(f" 混合策略路徑計算完成，總長度: {len(path)}")
     return path
 
+def plan_route_a_star_bounded(start: Coord, goal: Coord, warehouse_matrix: np.ndarray, dynamic_obstacles: List[Coord], forbidden_cells: Set[Coord], cost_map: Optional[Dict] = None, margin: int = BOUNDS_MARGIN) -> Optional[List[Coord]]:
+    """
+    將 A* 的展開範圍限制在起終點外接矩形 (外擴 `margin` 格) 內。
+    範圍內的結果只在長度等於曼哈頓距離 (單位成本下的下界，必為最短) 時採用；
+    否則 (找不到路徑，或框外可能有更短的繞行) 回退到全圖搜尋。
+    有加權 cost_map 時下界不成立，直接全圖搜尋。
+    """
+    if not cost_map:
+        bounds = (min(start[0], goal[0]) - margin, max(start[0], goal[0]) + margin,
+                  min(start[1], goal[1]) - margin, max(start[1], goal[1]) + margin)
+        path = plan_route_a_star(start, goal, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map, bounds=bounds)
+        if path is not None and len(path) == manhattan_distance(start, goal):
+            return path
+    return plan_route_a_star(start, goal, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
+
 def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray, dynamic_obstacles: List[Coord], forbidden_cells: Set[Coord]) -> List[Coord]:
     """
     A* 路徑搜尋，專用於混合策略內部路徑規劃。
@@ -374,15 +456,28 @@ def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray
     """
     if start == goal:
         return [start]
-    
+
+    # 障礙物轉成 frozenset 才能作為快取鍵；已是 frozenset 時不會重建
+    dyn_frozen = dynamic_obstacles if isinstance(dynamic_obstacles, frozenset) else frozenset(dynamic_obstacles or ())
+    forb_frozen = forbidden_cells if isinstance(forbidden_cells, frozenset) else frozenset(forbidden_cells or ())
+    segment = _internal_path_cached(start, goal, warehouse_matrix.tobytes(), warehouse_matrix.shape,
+                                    warehouse_matrix.dtype.str, dyn_frozen, forb_frozen)
+    return list(segment)  # 找不到路徑時為空列表
+
+@functools.lru_cache(maxsize=16384)
+def _internal_path_cached(start: Coord, goal: Coord, matrix_bytes: bytes, shape: Tuple[int, int], dtype: str,
+                          dyn_frozen: frozenset, forb_frozen: frozenset) -> Tuple[Coord, ...]:
+    """
+    a_star_internal_path 的快取本體，以地圖內容與障礙物集合為鍵，
+    跨撿貨輪次與跨任務重複的同一段路徑只搜尋一次。
+    """
+    warehouse_matrix = np.frombuffer(matrix_bytes, dtype=dtype).reshape(shape)
     # 基礎 A* 演算法返回的是從「下一步」開始的路徑段
-    path_segment = plan_route_a_star(start, goal, warehouse_matrix, dynamic_obstacles, forbidden_cells, None)
-    
+    path_segment = plan_route_a_star_bounded(start, goal, warehouse_matrix, dyn_frozen, forb_frozen)
     if path_segment:
         # 將起點加到路徑開頭，以符合內部邏輯的預期格式
-        return [start] + path_segment
-    
-    return []  # 如果找不到路徑
+        return (start, *path_segment)
+    return ()
 
 # --- 使用範例和測試函式 ---
 
@@ -22,6 +22,7 @@ Composite v2 策略運作原理：
     - 如果 `cost_map` 中未提供 `'m_v2_picks'`，或者路徑規劃失敗，則自動回退使用標準的 A* 演算法。
 """
 
+import functools
 from typing import List, Tuple, Dict, Optional, Set
 import numpy as np
 
@@ -41,106 +42,109 @@ GroupDict = Dict[str, List[Coord]]
 # SECTION 1: M-v2 核心邏輯 (排序與輔助函式)
 # =============================================================================
 
+def _half_bounds(half: str) -> Tuple[int, int]:
+    """回傳半區的 (前端 row, 後端 row)。"""
+    return (6, 0) if half == "upper" else (7, 13)
+
+def _rows_in_half(groups: GroupDict, half: str) -> List[int]:
+    keys = ("upper_front", "upper_back") if half == "upper" else ("lower_front", "lower_back")
+    return [r for k in keys for r, _c in groups.get(k, [])]
+
+def _farthest_depth_from_side(half: str, groups: GroupDict, side: str) -> int:
+    rows = _rows_in_half(groups, half)
+    if not rows: return 0
+    front_row, back_row = _half_bounds(half)
+    if side == "front":
+        return max(abs(front_row - r) for r in rows)
+    else:
+        return max(abs(r - back_row) for r in rows)
+
+def _has_both_sides(half: str, groups: GroupDict) -> bool:
+    if half == "upper":
+        return bool(groups.get("upper_front")) and bool(groups.get("upper_back"))
+    else:
+        return bool(groups.get("lower_front")) and bool(groups.get("lower_back"))
+
+def _order_return_both_groups(half: str, cur_side: str, groups: GroupDict) -> List[Coord]:
+    if half == "upper": g_front, g_back = "upper_front", "upper_back"
+    else: g_front, g_back = "lower_front", "lower_back"
+
+    seq: List[Coord] = []
+    if cur_side == "front":
+        if groups.get(g_front): seq += order_same_end(g_front, groups[g_front])
+        if groups.get(g_back): seq += order_same_end(g_back, groups[g_back])
+    else:
+        if groups.get(g_back): seq += order_same_end(g_back, groups[g_back])
+        if groups.get(g_front): seq += order_same_end(g_front, groups[g_front])
+    return seq
+
+def _decide_through(half: str, groups_now: GroupDict, cur_side: str, groups_next: Optional[GroupDict]) -> bool:
+    d_cur_front = _farthest_depth_from_side(half, groups_now, cur_side)
+    if d_cur_front == 0: return False
+
+    cost_through_now = d_cur_front
+    cost_return_now  = 2 * d_cur_front
+
+    if groups_next:
+        next_cost_if_through = _farthest_depth_from_side(half, groups_next, "back" if cur_side == "front" else "front")
+        next_cost_if_return  = _farthest_depth_from_side(half, groups_next, cur_side)
+    else:
+        next_cost_if_through = next_cost_if_return = 0
+
+    score_through = cost_through_now + next_cost_if_through
+    score_return  = cost_return_now  + next_cost_if_return
+
+    front_row, back_row = _half_bounds(half)
+    half_len = abs(front_row - back_row)
+    deep_threshold = max(1, half_len // 2)
+
+    if _has_both_sides(half, groups_now) and d_cur_front >= deep_threshold:
+        return True
+
+    return score_through < score_return
+
+def _sweep_one_half(aisles: Dict[str, Dict[int, GroupDict]], half: str, first_half: bool) -> List[Coord]:
+    ordered: List[Coord] = []
+    hd: Dict[int, GroupDict] = aisles[half]
+    if not hd: return ordered
+
+    xs = sorted(hd.keys(), reverse=first_half)
+    cur_side = "front"
+
+    for i, ax in enumerate(xs):
+        groups_now = hd[ax]
+        groups_next = hd.get(xs[i + 1]) if i + 1 < len(xs) else None
+        if not _rows_in_half(groups_now, half): continue
+
+        use_through = _decide_through(half, groups_now, cur_side, groups_next)
+
+        if use_through:
+            ordered += order_through_along_direction(half, groups_now, back_to_front=(cur_side == "back"))
+            cur_side = "back" if cur_side == "front" else "front"
+        else:
+            ordered += _order_return_both_groups(half, cur_side, groups_now)
+    return ordered
+
 def reorder_task_items(robot_start: Coord,
                        shelf_locations: List[Coord],
-                       wm: np.ndarray) -> List[Coord]:
+                       wm: np.ndarray,
+                       idx: Optional[Dict] = None) -> List[Coord]:
     """
     依 Composite 策略，重排整張任務的貨位訪問順序。
+    可傳入呼叫端已建好的 `idx` (build_index 結果) 以免重複建立。
     """
     if not shelf_locations:
         return []
 
-    idx = build_index(shelf_locations, wm)
+    if idx is None:
+        idx = _get_index(shelf_locations, wm)
     aisles = idx["aisles"]
 
-    def half_bounds(half: str) -> Tuple[int, int]:
-        return (6, 0) if half == "upper" else (7, 13)
-
-    def rows_in_half(groups: GroupDict, half: str) -> List[int]:
-        keys = ("upper_front", "upper_back") if half == "upper" else ("lower_front", "lower_back")
-        return [r for k in keys for r, _c in groups.get(k, [])]
-
-    def farthest_depth_from_side(half: str, groups: GroupDict, side: str) -> int:
-        rows = rows_in_half(groups, half)
-        if not rows: return 0
-        front_row, back_row = half_bounds(half)
-        if side == "front":
-            return max(abs(front_row - r) for r in rows)
-        else:
-            return max(abs(r - back_row) for r in rows)
-
-    def has_both_sides(half: str, groups: GroupDict) -> bool:
-        if half == "upper":
-            return bool(groups.get("upper_front")) and bool(groups.get("upper_back"))
-        else:
-            return bool(groups.get("lower_front")) and bool(groups.get("lower_back"))
-
-    def order_return_both_groups(half: str, cur_side: str, groups: GroupDict) -> List[Coord]:
-        if half == "upper": g_front, g_back = "upper_front", "upper_back"
-        else: g_front, g_back = "lower_front", "lower_back"
-
-        seq: List[Coord] = []
-        if cur_side == "front":
-            if groups.get(g_front): seq += order_same_end(g_front, groups[g_front])
-            if groups.get(g_back): seq += order_same_end(g_back, groups[g_back])
-        else:
-            if groups.get(g_back): seq += order_same_end(g_back, groups[g_back])
-            if groups.get(g_front): seq += order_same_end(g_front, groups[g_front])
-        return seq
-
-    def decide_through(half: str, groups_now: GroupDict, cur_side: str, groups_next: Optional[GroupDict]) -> bool:
-        d_cur_front = farthest_depth_from_side(half, groups_now, cur_side)
-        if d_cur_front == 0: return False
-
-        cost_through_now = d_cur_front
-        cost_return_now  = 2 * d_cur_front
-
-        def expected_next_cost(start_side: str) -> int:
-            if not groups_next: return 0
-            return farthest_depth_from_side(half, groups_next, start_side)
-
-        next_cost_if_through = expected_next_cost("back" if cur_side == "front" else "front")
-        next_cost_if_return  = expected_next_cost(cur_side)
-
-        score_through = cost_through_now + next_cost_if_through
-        score_return  = cost_return_now  + next_cost_if_return
-
-        front_row, back_row = half_bounds(half)
-        half_len = abs(front_row - back_row)
-        deep_threshold = max(1, half_len // 2)
-
-        if has_both_sides(half, groups_now) and d_cur_front >= deep_threshold:
-            return True
-
-        return score_through < score_return
-
-    def sweep_one_half(half: str, first_half: bool) -> List[Coord]:
-        ordered: List[Coord] = []
-        hd: Dict[int, GroupDict] = aisles[half]
-        if not hd: return ordered
-
-        xs = sorted(hd.keys(), reverse=first_half)
-        cur_side = "front"
-
-        for i, ax in enumerate(xs):
-            groups_now = hd[ax]
-            groups_next = hd.get(xs[i + 1]) if i + 1 < len(xs) else None
-            if not rows_in_half(groups_now, half): continue
-
-            use_through = decide_through(half, groups_now, cur_side, groups_next)
-
-            if use_through:
-                ordered += order_through_along_direction(half, groups_now, back_to_front=(cur_side == "back"))
-                cur_side = "back" if cur_side == "front" else "front"
-            else:
-                ordered += order_return_both_groups(half, cur_side, groups_now)
-        return ordered
-
     start_half = "upper" if in_upper(robot_start[0]) else "lower"
     other_half = "lower" if start_half == "upper" else "upper"
 
-    first  = sweep_one_half(start_half, first_half=True)
-    second = sweep_one_half(other_half,  first_half=False)
+    first  = _sweep_one_half(aisles, start_half, first_half=True)
+    second = _sweep_one_half(aisles, other_half,  first_half=False)
 
     return first + second
 
@@ -150,6 +154,19 @@ def reorder_task_items(robot_start: Coord,
 
 _m_v2_cache = {}
 
+def _get_index(pick_locations: List[Coord], wm: np.ndarray) -> Dict:
+    """取得撿貨點的走道索引，相同地圖內容與撿貨點序列只建立一次。"""
+    return _cached_index(tuple(map(tuple, pick_locations)), wm.tobytes(), wm.shape, wm.dtype.str)
+
+@functools.lru_cache(maxsize=256)
+def _cached_index(picks: Tuple[Coord, ...], matrix_bytes: bytes, shape: Tuple[int, int], dtype: str) -> Dict:
+    """
+    build_index 的快取本體。鍵值以地圖內容取代 id(wm)，並保留撿貨點的原始順序：
+    同列同組的貨位在排序後維持輸入順序，順序不同時結果也不同。
+    """
+    wm = np.frombuffer(matrix_bytes, dtype=dtype).reshape(shape)
+    return build_index(list(picks), wm)
+
 def get_m_v2_cache_key(start_pos: Coord, picks: List[Coord]) -> str:
     """生成 M-v2 策略快取的唯一鍵值"""
     picks_str = "_".join([f"{p[0]}-{p[1]}" for p in sorted(picks)])
@@ -159,13 +176,14 @@ def clear_m_v2_cache():
     """清除 M-v2 策略的快取"""
     global _m_v2_cache
     _m_v2_cache = {}
+    _cached_index.cache_clear()
 
 def plan_m_v2_complete_route(start_pos: Coord, pick_locations: List[Coord], wm: np.ndarray,
                              dynamic_obstacles: Optional[List[Coord]], forbidden_cells: Optional[Set[Coord]], cost_map: Optional[Dict]):
     """根據 M-v2 排序結果，生成完整的 A* 路徑。"""
-    idx = build_index(pick_locations, wm)
+    idx = _get_index(pick_locations, wm)
     ap_of = idx["ap_of"]
-    ordered_shelves = reorder_task_items(start_pos, pick_locations, wm)
+    ordered_shelves = reorder_task_items(start_pos, pick_locations, wm, idx)
 
     path = [start_pos]
     curr = start_pos
@@ -193,6 +211,11 @@ def plan_route(start_pos: Coord, target_pos: Coord, warehouse_matrix: np.ndarray
     """
     if cost_map is None: cost_map = {}
 
+    return _plan_route_impl(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
+
+def _plan_route_impl(start_pos: Coord, target_pos: Coord, warehouse_matrix: np.ndarray,
+                     dynamic_obstacles, forbidden_cells, cost_map: Dict):
+    """plan_route 的主體，cost_map 須已正規化。"""
     if 'm_v2_picks' in cost_map and len(cost_map['m_v2_picks']) > 1:
         pick_locations = cost_map['m_v2_picks']
         print(f"🗺️ 啟用 M-v2 策略，撿貨點: {pick_locations}")
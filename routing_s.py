@@ -30,39 +30,51 @@ S-Shape 策略運作原理：
    - 輸出: 從「下一步」到終點的路徑列表，例如：[(0,1), (0,2), (1,2)]
 """
 
+import bisect
+import functools
 import heapq
+import itertools
+import logging
 import math
-from typing import List, Tuple, Optional, Set, Dict
+from collections import OrderedDict
+from typing import Iterable, List, Tuple, Optional, Set, Dict
 import numpy as np
 from warehouse_layout import (
     is_turn_point,
     find_nearest_turn_point
 )
+from routing import find_adjacent_aisle  # 與基礎範本共用，不另外維護一份
+
+__all__ = [
+    'plan_route',
+    'plan_route_a_star',
+    'plan_s_shape_complete_route',
+    'a_star_internal_path',
+    'clear_s_shape_cache',
+    'get_robot_key',
+    'get_passable_mask',
+    'neighbor_table',
+    'reconstruct_path',
+    'euclidean_distance',
+    'find_adjacent_aisle',
+]
 
 # --- 型別別名，方便閱讀 ---
 Coord = Tuple[int, int]
 
-def euclidean_distance(pos1: Coord, pos2: Coord) -> float:
-    """【輔助函式】計算兩點之間的歐幾里得距離。"""
-    return math.sqrt((pos1[0] - pos2[0])**2 + (pos1[1] - pos2[1])**2)
+# 除錯訊息走 logging；每次規劃開始時檢查一次層級，關閉時熱路徑不做字串格式化與 I/O。
+_log = logging.getLogger(__name__)
 
-def find_adjacent_aisle(pos: Coord, warehouse_matrix: np.ndarray) -> Optional[Coord]:
-    """
-    尋找給定位置旁邊的第一個可用走道格。
-    這對於將機器人從貨架或工作站移到路徑上至關重要。
+# 可通行的格子代號 (走道與特殊區域)
+PASSABLE_CODES = (0, 4, 5, 6, 7)
 
-    :param pos: 當前位置 (例如貨架)。
-    :param warehouse_matrix: 倉庫佈局。
-    :return: 旁邊的走道座標，如果找不到則返回 None。
-    """
-    rows, cols = warehouse_matrix.shape
-    r, c = pos
-    candidates = [(r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)]
-    for nr, nc in candidates:
-        if 0 <= nr < rows and 0 <= nc < cols and warehouse_matrix[nr, nc] == 0:
-            return (nr, nc)
-    return None
+def _euclidean_distance_sq(pos1: Coord, pos2: Coord) -> int:
+    """【輔助函式】兩點距離的平方；僅需比較遠近時使用，省去開根號。"""
+    return (pos1[0] - pos2[0])**2 + (pos1[1] - pos2[1])**2
 
+def euclidean_distance(pos1: Coord, pos2: Coord) -> float:
+    """【輔助函式】計算兩點之間的歐幾里得距離。"""
+    return math.sqrt(_euclidean_distance_sq(pos1, pos2))
 
 def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optional[List[Coord]] = None, forbidden_cells: Optional[Set[Coord]] = None, cost_map: Optional[Dict[Coord, int]] = None):
     """【核心策略函式】- S-Shape 策略實作
@@ -94,8 +106,10 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     4. 如果不適用 S-shape，回退到標準 A* 演算法
     ---
     """
+    debug = _log.isEnabledFor(logging.DEBUG)
     # 調試信息：記錄路徑規劃的參數
-    print(f"S-Shape 路徑規劃: {start_pos} -> {target_pos}")
+    if debug:
+        _log.debug("S-Shape 路徑規劃: %s -> %s", start_pos, target_pos)
     
     # 初始化參數
     if forbidden_cells is None:
@@ -108,95 +122,131 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     # 檢查是否使用 S-shape 策略
     if 's_shape_picks' in cost_map and len(cost_map['s_shape_picks']) > 1:
         pick_locations = cost_map['s_shape_picks']
-        print(f" 啟用 S-shape 策略，撿貨點: {pick_locations}")
+        if debug:
+            _log.debug("啟用 S-shape 策略，撿貨點: %s", pick_locations)
         
         # 生成快取鍵值
-        cache_key = get_robot_key(start_pos, pick_locations)
+        cache_key = get_robot_key(start_pos, pick_locations, dynamic_obstacles, forbidden_cells)
         
-        # 檢查快取
-        if cache_key not in _s_shape_cache:
+        # 檢查快取；命中時移到最近使用端
+        if cache_key in _s_shape_cache:
+            _s_shape_cache.move_to_end(cache_key)
+        else:
             # 計算完整的 S-shape 路徑
             full_path = plan_s_shape_complete_route(start_pos, pick_locations, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
             if full_path:
+                # 座標 -> 在完整路徑中出現的索引 (遞增)，取段落時免去線性搜尋
+                pos_index: Dict[Coord, List[int]] = {}
+                for i, p in enumerate(full_path):
+                    pos_index.setdefault(p, []).append(i)
                 _s_shape_cache[cache_key] = {
                     "full_path": full_path,
+                    "pos_index": pos_index,
                     "picks": pick_locations.copy()
                 }
-                print(f" 快取 S-shape 路徑，共 {len(full_path)} 步")
+                if len(_s_shape_cache) > S_SHAPE_CACHE_SIZE:
+                    _s_shape_cache.popitem(last=False)  # 丟棄最久未使用的記錄
+                if debug:
+                    _log.debug("快取 S-shape 路徑，共 %d 步", len(full_path))
             else:
-                print(" S-shape 路徑規劃失敗，回退到 A* 演算法")
+                if debug:
+                    _log.debug("S-shape 路徑規劃失敗，回退到 A* 演算法")
                 return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
         
         # 從快取中取得路徑並返回適當段落
         cached_data = _s_shape_cache[cache_key]
         full_path = cached_data["full_path"]
+        pos_index = cached_data["pos_index"]
         
-        try:
-            # 找到起點在完整路徑中的位置
-            start_idx = full_path.index(start_pos)
-            
-            # 找到終點在完整路徑中的位置
-            if target_pos in full_path[start_idx:]:
-                end_idx = full_path.index(target_pos, start_idx)
-                # 返回從下一步到終點的路徑段
-                result_path = full_path[start_idx + 1:end_idx + 1]
-                print(f"返回 S-shape 路徑段: {len(result_path)} 步")
-                return result_path if result_path else None
-            else:
-                print("目標點不在 S-shape 路徑中，回退到 A* 演算法")
-                return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
-        except ValueError:
-            print("起點不在 S-shape 路徑中，回退到 A* 演算法")
+        # 找到起點在完整路徑中的位置
+        start_indices = pos_index.get(start_pos)
+        if not start_indices:
+            if debug:
+                _log.debug("起點不在 S-shape 路徑中，回退到 A* 演算法")
+            return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
+        start_idx = start_indices[0]
+        
+        # 找到起點之後第一次出現終點的位置
+        end_indices = pos_index.get(target_pos, [])
+        k = bisect.bisect_left(end_indices, start_idx)
+        if k < len(end_indices):
+            end_idx = end_indices[k]
+            # 返回從下一步到終點的路徑段
+            result_path = full_path[start_idx + 1:end_idx + 1]
+            if debug:
+                _log.debug("返回 S-shape 路徑段: %d 步", len(result_path))
+            return result_path if result_path else None
+        else:
+            if debug:
+                _log.debug("目標點不在 S-shape 路徑中，回退到 A* 演算法")
             return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
     
     # 不使用 S-shape 策略，使用標準 A* 演算法
     return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
 
 
-def plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map):
-    """標準 A* 路徑規劃演算法 (原始實作)"""
+def plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optional[Iterable[Coord]], forbidden_cells: Optional[Iterable[Coord]], cost_map):
+    """標準 A* 路徑規劃演算法 (原始實作)
+    內部以整數節點編號 r * cols + c 運算，只在返回路徑時轉回座標。
+    """
     rows, cols = warehouse_matrix.shape
+    target_r, target_c = target_pos
+    start_id = start_pos[0] * cols + start_pos[1]
+    target_id = target_r * cols + target_c
+
+    # 入口處把可通行、障礙物、禁止區域融合成單一遮罩 (目標格永遠可進入)，成本表轉成節點編號
+    blocked = build_blocked_mask(rows, cols, dynamic_obstacles, forbidden_cells)
+    traversable = build_traversable_mask(get_passable_mask(warehouse_matrix), blocked, target_id)
+    node_costs = {
+        k[0] * cols + k[1]: v
+        for k, v in cost_map.items()
+        if isinstance(k, tuple) and isinstance(v, int) and 0 <= k[0] < rows and 0 <= k[1] < cols
+    }
+
+    adjacency = neighbor_table(rows, cols)
 
-    def neighbors(pos: Coord) -> List[Coord]:
-        r, c = pos
-        candidates = [(r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)] # 四個方向
-        valid_neighbors = []
-        for nr, nc in candidates:
-            if 0 <= nr < rows and 0 <= nc < cols:
-                # 檢查動態障礙物 (除非它是我們的最終目標)
-                if dynamic_obstacles and (nr, nc) in dynamic_obstacles and (nr, nc) != target_pos:
-                    continue
-
-                # 檢查呼叫者提供的絕對禁止區域 (除非它是我們的最終目標)
-                if (nr, nc) in forbidden_cells and (nr, nc) != target_pos:
-                    continue
-
-                # 檢查靜態倉庫佈局。所有非障礙物的格子都是可通行的。
-                cell_type = warehouse_matrix[nr, nc]
-                if cell_type in [0, 4, 5, 6, 7] or (nr, nc) == target_pos:
-                    valid_neighbors.append((nr, nc))
-        return valid_neighbors
-
-    def heuristic(pos):
-        # 啟發函式 (Heuristic): 使用曼哈頓距離，這在網格地圖上通常很有效。
-        return abs(pos[0] - target_pos[0]) + abs(pos[1] - target_pos[1])
+    def neighbors(node: int) -> List[int]:
+        # 界內的四個方向中，可進入的格子
+        return [nb for nb in adjacency[node] if traversable[nb]]
+
+    # 啟發函式 (Heuristic): 使用曼哈頓距離，這在網格地圖上通常很有效。
+    # 以目標為鍵的整張距離表跨呼叫重用，展開節點時只需查表。
+    heuristic = heuristic_table(target_id, rows, cols).__getitem__
 
     # --- A* 演算法主體 ---
-    open_list = [(heuristic(start_pos), 0, start_pos, [])]  # (f_score, g_score, pos, path)
-    closed_set = set()
+    # 堆積元素打包成單一整數，由高位到低位依序為 (f_score, g_score, counter, node)，
+    # 比較時只需一次整數比較；各欄位寬度依地圖大小與最大成本決定，不會互相溢位。
+    size = rows * cols
+    cnt_shift = size.bit_length()
+    g_shift = cnt_shift + (4 * size + 1).bit_length()
+    f_shift = g_shift + (max(max(node_costs.values(), default=1), 1) * size).bit_length()
+    node_mask = (1 << cnt_shift) - 1
+    tiebreak = itertools.count()  # 同 f、g 值時依加入順序取出
+
+    def pack(f_score: int, g_score: int, node: int) -> int:
+        return (f_score << f_shift) | (g_score << g_shift) | (next(tiebreak) << cnt_shift) | node
+
+    open_list = [pack(heuristic(start_id), 0, start_id)]
+    came_from: Dict[int, int] = {}
+    g_score: Dict[int, int] = {start_id: 0}
+    closed_set: Set[int] = set()
 
     while open_list:
-        f, g, current, path = heapq.heappop(open_list)
+        # 先查看堆頂而不取出；展開時第一個鄰居以 heapreplace 直接取代堆頂，省一次篩選
+        current = open_list[0] & node_mask
 
         if current in closed_set:
+            heapq.heappop(open_list)
             continue
 
         # 如果到達目標，重建並返回路徑
-        if current == target_pos:
+        if current == target_id:
             # 根據「合約」，我們需要返回從「下一步」開始的路徑。
-            return (path + [current])[1:]
+            return [divmod(node, cols) for node in reconstruct_path(came_from, current)[1:]]
 
         closed_set.add(current)
+        g = g_score[current]
+        top_replaced = False
 
         # 探索所有有效的鄰居節點
         for neighbor in neighbors(current):
@@ -204,30 +254,109 @@ def plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles
                 continue
             
             # 計算移動到鄰居的成本 (g_score)
-            move_cost = cost_map.get(neighbor, 1) if isinstance(cost_map.get(neighbor), int) else 1
-            new_g = g + move_cost
-            # 計算 f_score = g_score + h_score
-            new_f = new_g + heuristic(neighbor)
-            # 將鄰居節點加入優先佇列
-            heapq.heappush(open_list, (new_f, new_g, neighbor, path + [current]))
+            new_g = g + node_costs.get(neighbor, 1)
+            if new_g < g_score.get(neighbor, math.inf):
+                g_score[neighbor] = new_g
+                came_from[neighbor] = current
+                # 計算 f_score = g_score + h_score，並將鄰居節點加入優先佇列
+                entry = pack(new_g + heuristic(neighbor), new_g, neighbor)
+                if top_replaced:
+                    heapq.heappush(open_list, entry)
+                else:
+                    heapq.heapreplace(open_list, entry)
+                    top_replaced = True
+
+        if not top_replaced:
+            heapq.heappop(open_list)
 
     return None  # 如果 open_list 為空仍未找到路徑，則表示無解
 
+def reconstruct_path(came_from: Dict[int, int], current: int) -> List[int]:
+    """沿 came_from 由終點回溯到起點，返回包含起點的完整節點序列。"""
+    path = [current]
+    while current in came_from:
+        current = came_from[current]
+        path.append(current)
+    path.reverse()
+    return path
+
 
 # --- S-shape 策略全域狀態管理 ---
 # 儲存每個機器人的 S-shape 路徑狀態
-# 格式: robot_position_key -> {"full_path": [...], "picks_remaining": [...], "current_target": Coord}
-_s_shape_cache = {}
+# 格式: robot_position_key -> {"full_path": [...], "pos_index": {...}, "picks": [...]}
+# 鍵值含障礙物集合，記錄數會隨之增加；以 LRU 順序保存，超過上限時丟棄最久未使用者
+S_SHAPE_CACHE_SIZE = 256
+_s_shape_cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+
+def get_robot_key(start_pos: Coord, picks: List[Coord],
+                  dynamic_obstacles: Optional[Iterable[Coord]] = None,
+                  forbidden_cells: Optional[Iterable[Coord]] = None) -> tuple:
+    """
+    生成機器人狀態的唯一鍵值。
+    鍵值包含當下的障礙物與禁止區域，障礙物不同時不會誤用到穿過封鎖格的舊路徑。
+    """
+    return (tuple(start_pos), tuple(sorted(picks)),
+            frozenset(dynamic_obstacles or ()), frozenset(forbidden_cells or ()))
 
-def get_robot_key(start_pos: Coord, picks: List[Coord]) -> str:
-    """生成機器人狀態的唯一鍵值"""
-    picks_str = "_".join([f"{p[0]}-{p[1]}" for p in sorted(picks)])
-    return f"{start_pos[0]}-{start_pos[1]}_{picks_str}"
+@functools.lru_cache(maxsize=8)
+def neighbor_table(rows: int, cols: int) -> Tuple[Tuple[int, ...], ...]:
+    """
+    以 NumPy 一次算出每個節點在界內的四鄰節點編號 (順序: 下、上、右、左)。
+    A* 展開節點時直接查表，省去逐格的邊界檢查與座標換算。
+    """
+    ids = np.arange(rows * cols)
+    r, c = np.divmod(ids, cols)
+    candidates = np.stack([ids + cols, ids - cols, ids + 1, ids - 1], axis=1)
+    in_bounds = np.stack([r + 1 < rows, r > 0, c + 1 < cols, c > 0], axis=1)
+    return tuple(tuple(cand[mask].tolist()) for cand, mask in zip(candidates, in_bounds))
+
+@functools.lru_cache(maxsize=256)
+def heuristic_table(target: int, rows: int, cols: int) -> Tuple[int, ...]:
+    """
+    以 NumPy 一次算出每個節點到 target 的曼哈頓距離 (索引為 r * cols + c)。
+    同一目標在多段 A* 與多個 tick 之間共用同一張表。
+    """
+    tr, tc = divmod(target, cols)
+    r, c = np.divmod(np.arange(rows * cols), cols)
+    return tuple((np.abs(r - tr) + np.abs(c - tc)).tolist())
+
+def get_passable_mask(warehouse_matrix: np.ndarray) -> bytes:
+    """取得扁平化的可通行遮罩 (索引為 r * cols + c)，依地圖內容快取，每張地圖只計算一次。"""
+    return _grid_derived(warehouse_matrix.tobytes(), warehouse_matrix.shape, warehouse_matrix.dtype.str)
+
+@functools.lru_cache(maxsize=4)
+def _grid_derived(matrix_bytes: bytes, shape: Tuple[int, int], dtype: str) -> bytes:
+    """
+    依地圖「內容」計算可通行遮罩。
+    內容相同的不同矩陣物件 (例如各處的 copy) 會拿到同一個遮罩物件，內部路徑快取因此可以共用。
+    """
+    matrix = np.frombuffer(matrix_bytes, dtype=dtype).reshape(shape)
+    return np.isin(matrix, PASSABLE_CODES).astype(np.uint8).tobytes()
+
+def build_blocked_mask(rows: int, cols: int, dynamic_obstacles: Optional[Iterable[Coord]],
+                       forbidden_cells: Optional[Iterable[Coord]]) -> bytes:
+    """將動態障礙物與禁止區域標記成扁平化的封鎖遮罩 (索引為 r * cols + c)，界外座標忽略。"""
+    blocked = np.zeros((rows, cols), dtype=np.bool_)
+    cells = list(itertools.chain(dynamic_obstacles or (), forbidden_cells or ()))
+    if cells:
+        rc = np.array(cells, dtype=np.int64).reshape(-1, 2)
+        rc = rc[(rc[:, 0] >= 0) & (rc[:, 0] < rows) & (rc[:, 1] >= 0) & (rc[:, 1] < cols)]
+        blocked[rc[:, 0], rc[:, 1]] = True
+    return blocked.tobytes()
+
+def build_traversable_mask(passable: bytes, blocked: bytes, *always_open: int) -> bytearray:
+    """融合可通行與封鎖遮罩：可通行且未封鎖的節點為 1；always_open 指定的節點 (起點、終點) 一律可進入。"""
+    traversable = bytearray((np.frombuffer(passable, dtype=np.uint8) & ~np.frombuffer(blocked, dtype=np.uint8)).tobytes())
+    for node in always_open:
+        traversable[node] = 1
+    return traversable
 
 def clear_s_shape_cache():
     """清除所有 S-shape 快取"""
     global _s_shape_cache
-    _s_shape_cache = {}
+    _s_shape_cache = OrderedDict()
+    _grid_derived.cache_clear()
+    _astar_raw.cache_clear()
 
 def plan_s_shape_complete_route(start_pos: Coord, pick_locations: List[Coord], warehouse_matrix: np.ndarray, dynamic_obstacles: List[Coord], forbidden_cells: Set[Coord], cost_map: Dict) -> List[Coord]:
     """
@@ -247,43 +376,52 @@ def plan_s_shape_complete_route(start_pos: Coord, pick_locations: List[Coord], w
     if not pick_locations:
         return [start_pos]
 
+    debug = _log.isEnabledFor(logging.DEBUG)
     path = [start_pos]
     curr = start_pos
+    # 整趟規劃共用同一組 frozenset，內部路徑快取鍵只需雜湊一次
+    dynamic_obstacles = frozenset(dynamic_obstacles or ())
+    forbidden_cells = frozenset(forbidden_cells or ())
 
     # 1. 找出所有需要撿貨的巷道並排序
-    remaining_picks = pick_locations.copy()
-    aisles_to_visit = sorted(list(set(p[1] for p in remaining_picks)))
+    #    以 lexsort 一次依 (巷道, row) 排好所有撿貨點，每個巷道對應排序後的一段連續區間
+    picks_arr = np.array(pick_locations, dtype=np.int32).reshape(-1, 2)
+    picks_arr = picks_arr[np.lexsort((picks_arr[:, 0], picks_arr[:, 1]))]
+    aisle_cols, aisle_starts = np.unique(picks_arr[:, 1], return_index=True)
+    aisles_to_visit = aisle_cols.tolist()
+    aisle_bounds = aisle_starts.tolist() + [len(picks_arr)]
+    picks_sorted = [tuple(p) for p in picks_arr.tolist()]
 
-    print(f" 開始純正 S-shape 路徑計算，起點: {start_pos}，目標巷道: {aisles_to_visit}")
+    if debug:
+        _log.debug("開始純正 S-shape 路徑計算，起點: %s，目標巷道: %s", start_pos, aisles_to_visit)
 
     # 2. 交替清掃方向，1=向下, -1=向上
     sweep_direction = 1
 
-    for aisle_col in aisles_to_visit:
-        print(f"\n  清掃巷道: {aisle_col}, 方向: {'下' if sweep_direction == 1 else '上'}")
+    for k, aisle_col in enumerate(aisles_to_visit):
+        if debug:
+            _log.debug("清掃巷道: %s, 方向: %s", aisle_col, '下' if sweep_direction == 1 else '上')
 
         # 3. 決定入口和出口轉彎點
+        top_turn, bottom_turn = _aisle_endpoints(aisle_col, warehouse_matrix.shape[0])
         if sweep_direction == 1: # 向下掃
-            entry_turn = find_nearest_turn_point((0, aisle_col), 'any')
-            exit_turn = find_nearest_turn_point((warehouse_matrix.shape[0]-1, aisle_col), 'any')
+            entry_turn, exit_turn = top_turn, bottom_turn
         else: # 向上掃
-            entry_turn = find_nearest_turn_point((warehouse_matrix.shape[0]-1, aisle_col), 'any')
-            exit_turn = find_nearest_turn_point((0, aisle_col), 'any')
+            entry_turn, exit_turn = bottom_turn, top_turn
 
         # 從當前位置移動到入口轉彎點
         if curr != entry_turn:
-            print(f"  → 前往入口: {entry_turn}")
+            if debug:
+                _log.debug("→ 前往入口: %s", entry_turn)
             segment = a_star_internal_path(curr, entry_turn, warehouse_matrix, dynamic_obstacles, forbidden_cells)
             if segment and len(segment) > 1:
                 path.extend(segment[1:])
             curr = entry_turn
         
         # 4. 找出該巷道內的所有撿貨點，並根據清掃方向排序
-        aisle_picks = sorted(
-            [p for p in remaining_picks if p[1] == aisle_col],
-            key=lambda p: p[0],
-            reverse=(sweep_direction == -1)
-        )
+        aisle_picks = picks_sorted[aisle_bounds[k]:aisle_bounds[k + 1]]
+        if sweep_direction == -1:
+            aisle_picks.reverse()
         
         # 逐一撿貨
         for pick_pos in aisle_picks:
@@ -292,19 +430,16 @@ def plan_s_shape_complete_route(start_pos: Coord, pick_locations: List[Coord], w
                 if len(segment) > 1:
                     path.extend(segment[1:])
                 curr = pick_pos
-                # 從剩餘清單中移除已撿的貨物
-                if pick_pos in remaining_picks:
-                    remaining_picks.remove(pick_pos)
-                print(f"     撿貨完成: {pick_pos}")
+                if debug:
+                    _log.debug("撿貨完成: %s", pick_pos)
             else:
-                print(f"    無法到達撿貨點: {pick_pos}")
-                # 同樣移除無法到達的點，避免重複嘗試
-                if pick_pos in remaining_picks:
-                    remaining_picks.remove(pick_pos)
+                if debug:
+                    _log.debug("無法到達撿貨點: %s", pick_pos)
         
         # 5. 撿完後，移動到出口轉彎點
         if curr != exit_turn:
-            print(f"  → 前往出口: {exit_turn}")
+            if debug:
+                _log.debug("→ 前往出口: %s", exit_turn)
             segment = a_star_internal_path(curr, exit_turn, warehouse_matrix, dynamic_obstacles, forbidden_cells)
             if segment and len(segment) > 1:
                 path.extend(segment[1:])
@@ -313,59 +448,101 @@ def plan_s_shape_complete_route(start_pos: Coord, pick_locations: List[Coord], w
         # 6. 反轉清掃方向，為下一個巷道做準備
         sweep_direction *= -1
     
-    print(f"🎉 S-shape 路徑計算完成，總長度: {len(path)}")
+    if debug:
+        _log.debug("S-shape 路徑計算完成，總長度: %d", len(path))
     return path
 
-def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray, dynamic_obstacles: List[Coord], forbidden_cells: Set[Coord]) -> List[Coord]:
+@functools.lru_cache(maxsize=1024)
+def _aisle_endpoints(aisle_col: int, rows: int) -> Tuple[Coord, Coord]:
+    """巷道頂端與底端最近的轉彎點，依 (巷道, 列數) 快取。"""
+    return (find_nearest_turn_point((0, aisle_col), 'any'),
+            find_nearest_turn_point((rows - 1, aisle_col), 'any'))
+
+def a_star_internal_path(start: Coord, goal: Coord, warehouse_matrix: np.ndarray, dynamic_obstacles: Iterable[Coord], forbidden_cells: Iterable[Coord]) -> List[Coord]:
     """A* 路徑搜尋，專用於 S-shape 內部路徑規劃"""
     if start == goal:
         return [start]
     
     rows, cols = warehouse_matrix.shape
-    
-    def neighbors(pos: Coord) -> List[Coord]:
-        r, c = pos
-        candidates = [(r + 1, c), (r - 1, c), (r, c + 1), (r, c - 1)]
-        valid = []
-        for nr, nc in candidates:
-            if 0 <= nr < rows and 0 <= nc < cols:
-                # 檢查動態障礙物
-                if (nr, nc) in dynamic_obstacles and (nr, nc) != goal:
-                    continue
-                # 檢查禁止區域
-                if (nr, nc) in forbidden_cells and (nr, nc) != goal:
-                    continue
-                # 檢查倉庫佈局
-                cell_type = warehouse_matrix[nr, nc]
-                if cell_type in [0, 4, 5, 6, 7] or (nr, nc) == goal:
-                    valid.append((nr, nc))
-        return valid
-    
-    def heuristic(pos):
-        return abs(pos[0] - goal[0]) + abs(pos[1] - goal[1])
-    
-    open_list = [(heuristic(start), 0, start, [start])]
-    closed_set = set()
-    
-    while open_list:
-        f, g, current, path = heapq.heappop(open_list)
-        
-        if current in closed_set:
+    # 障礙物轉成 frozenset 才能作為快取鍵；已是 frozenset 時不會重建
+    dyn_frozen = frozenset(dynamic_obstacles or ())
+    forb_frozen = frozenset(forbidden_cells or ())
+    path = _astar_raw(start, goal, get_passable_mask(warehouse_matrix), rows, cols, dyn_frozen, forb_frozen)
+    return list(path)  # 無路徑時為空列表；複製一份避免呼叫端改動快取內容
+
+@functools.lru_cache(maxsize=4096)
+def _astar_raw(start: Coord, goal: Coord, passable: bytes, rows: int, cols: int,
+               dyn_frozen: frozenset, forb_frozen: frozenset) -> Tuple[Coord, ...]:
+    """a_star_internal_path 的快取本體，相同地圖與障礙物下的同一段路徑只搜尋一次。"""
+    start_id = start[0] * cols + start[1]
+    goal_id = goal[0] * cols + goal[1]
+    blocked = build_blocked_mask(rows, cols, dyn_frozen, forb_frozen)
+    traversable = build_traversable_mask(passable, blocked, start_id, goal_id)
+    nodes = _bidir_astar(start_id, goal_id, traversable, rows, cols)
+    return tuple(divmod(node, cols) for node in nodes)
+
+def _bidir_astar(start: int, goal: int, traversable: bytearray, rows: int, cols: int) -> List[int]:
+    """
+    單位成本的雙向 A*，由起點與終點同時展開並於中途相遇，全程以整數節點索引運算。
+    每輪展開較小的前沿；heap 元素打包為 (f << 32) | node。
+    任一側最小 f 值不小於目前最佳相遇成本時即停止，結果仍為最短路徑。
+    返回由起點到終點 (含兩端) 的節點索引；找不到路徑時返回空列表。
+    """
+    size = rows * cols
+    unreached = size  # 單位成本下 g 不會超過格數
+    adjacency = neighbor_table(rows, cols)
+    g_score = ([unreached] * size, [unreached] * size)  # 0: 正向, 1: 反向
+    came_from = ([-1] * size, [-1] * size)
+    closed = (bytearray(size), bytearray(size))
+    h_tables = (heuristic_table(goal, rows, cols), heuristic_table(start, rows, cols))  # 各方向啟發函式的距離表
+    g_score[0][start] = 0
+    g_score[1][goal] = 0
+    h0 = h_tables[0][start]
+    open_heaps = ([(h0 << 32) | start], [(h0 << 32) | goal])
+    best_cost = unreached
+    meet = -1
+
+    while open_heaps[0] and open_heaps[1]:
+        if (open_heaps[0][0] >> 32) >= best_cost or (open_heaps[1][0] >> 32) >= best_cost:
+            break
+
+        side = 0 if len(open_heaps[0]) <= len(open_heaps[1]) else 1
+        heap = open_heaps[side]
+        g_side, g_other = g_score[side], g_score[1 - side]
+        parent, done = came_from[side], closed[side]
+        h_side = h_tables[side]
+
+        node = heapq.heappop(heap) & 0xFFFFFFFF
+        if done[node]:
             continue
-            
-        if current == goal:
-            return path
-            
-        closed_set.add(current)
-        
-        for neighbor in neighbors(current):
-            if neighbor in closed_set:
+        done[node] = 1
+        new_g = g_side[node] + 1
+
+        for nb in adjacency[node]:
+            if done[nb] or new_g >= g_side[nb] or not traversable[nb]:
                 continue
-            new_g = g + 1
-            new_f = new_g + heuristic(neighbor)
-            heapq.heappush(open_list, (new_f, new_g, neighbor, path + [neighbor]))
-    
-    return []  # 無路徑
+            g_side[nb] = new_g
+            parent[nb] = node
+            if new_g + g_other[nb] < best_cost:
+                best_cost = new_g + g_other[nb]
+                meet = nb
+            heapq.heappush(heap, ((new_g + h_side[nb]) << 32) | nb)
+
+    if meet < 0:
+        return []
+
+    # 正向段: 相遇點回溯至起點後反轉；反向段: 相遇點沿反向父節點走到終點
+    path = [meet]
+    node = meet
+    while node != start:
+        node = came_from[0][node]
+        path.append(node)
+    path.reverse()
+    node = meet
+    while node != goal:
+        node = came_from[1][node]
+        path.append(node)
+    return path
 
 # --- 使用範例和測試函式 ---
 
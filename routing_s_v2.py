@@ -5,23 +5,108 @@
 """
 
 import numpy as np
+import functools
 import heapq
+import itertools
+import logging
 import math
 from typing import List, Tuple, Dict, Optional, Set
 
 # --- 從通用模組匯入，確保一致性 ---
-from routing import plan_route as plan_route_a_star, euclidean_distance
+from routing import plan_route as plan_route_a_star
 
 # --- 型別別名 ---
 Coord = Tuple[int, int]
 
+# 除錯訊息走 logging (含開始與結束摘要)；每次規劃開始時檢查一次層級，關閉時熱迴圈不做字串格式化與 I/O。
+_log = logging.getLogger(__name__)
+
+def _sqdist(a: Coord, b: Coord) -> int:
+    """兩點距離的平方；只用於比較遠近時免去開根號。"""
+    dr = a[0] - b[0]
+    dc = a[1] - b[1]
+    return dr * dr + dc * dc
+
+# A* 展開的四個方向 (下、上、右、左)
+_DIRS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
 # --- 全域路徑快取 ---
-_s_shape_cache = {}
+# 快取鍵以地圖內容 (位元組、形狀、dtype) 表示，就地修改或 id 被重用的地圖不會取到舊路徑
+@functools.lru_cache(maxsize=256)
+def _cached_s_shape(matrix_bytes: bytes, shape: Tuple[int, int], dtype: str,
+                    start_pos: Coord, pick_locations: Tuple[Coord, ...],
+                    dyn_key: frozenset, forbid_key: frozenset
+                    ) -> Optional[Tuple[Tuple[Coord, ...], Dict[Coord, int]]]:
+    """
+    計算完整的 S-Shape 路徑 (含起點)；相同地圖、起點、撿貨點與障礙物只計算一次。
+    返回 (完整路徑, 座標 -> 首次出現索引)，供切片時 O(1) 查詢；無法生成路徑時返回 None (同樣會被快取)。
+    """
+    wm = np.frombuffer(matrix_bytes, dtype=dtype).reshape(shape)
+    planner = ImprovedSShapePathPlanner(wm)
+    full_path = planner.execute_items_only(start_pos, list(pick_locations), dyn_key, forbid_key)
+    if not full_path:
+        return None
+    idx_map: Dict[Coord, int] = {}
+    for i, node in enumerate(full_path):
+        idx_map.setdefault(node, i)
+    return tuple(full_path), idx_map
 
 def clear_s_shape_cache():
     """清除 S-Shape 策略的全域路徑快取。"""
-    global _s_shape_cache
-    _s_shape_cache = {}
+    _cached_s_shape.cache_clear()
+
+def _astar_flat(blocked: bytearray, sr: int, sc: int, gr: int, gc: int,
+                rows: int, cols: int) -> Optional[List[int]]:
+    """
+    單位成本 A* 核心，全程以整數節點 r * cols + c 運算。
+    `blocked` 已合併靜態不可通行格與動態封鎖，非零即不可進入 (終點除外)。
+    取出順序與 routing.plan_route 相同：依 (f, g, 節點) 排序 (節點編號與座標元組同序)；
+    同一節點有多個 g 相同的前驅時，取起點至前驅路徑字典序最小者，路徑形狀因此與基礎 A* 一致。
+    heap 元素打包為 f << f_shift | g << node_bits | node，各欄位寬度依格數決定，不會互相溢位。
+    返回不含起點的節點序列 (起點即終點時為空列表)；找不到路徑時返回 None。
+    """
+    size = rows * cols
+    node_bits = size.bit_length()
+    node_mask = (1 << node_bits) - 1
+    f_shift = node_bits + (2 * size).bit_length()  # g 不超過格數
+    start = sr * cols + sc
+    goal = gr * cols + gc
+    g_score = [-1] * size
+    came_from = [-1] * size
+    closed = bytearray(size)
+    trail: Dict[int, Tuple[int, ...]] = {start: (start,)}  # 已關閉節點自起點起的完整路徑，供同 g 前驅比較
+    g_score[start] = 0
+    open_heap = [((abs(sr - gr) + abs(sc - gc)) << f_shift) | start]
+
+    while open_heap:
+        node = heapq.heappop(open_heap) & node_mask
+        if closed[node]:
+            continue
+        if node != start:
+            trail[node] = trail[came_from[node]] + (node,)
+        if node == goal:
+            return list(trail[node][1:])
+        closed[node] = 1
+        r, c = divmod(node, cols)
+        tentative = g_score[node] + 1
+        for dr, dc in _DIRS:
+            nr, nc = r + dr, c + dc
+            if not (0 <= nr < rows and 0 <= nc < cols):
+                continue
+            n = nr * cols + nc
+            if closed[n]:
+                continue
+            # 終點永遠可進入；其他格須未被封鎖
+            if n != goal and blocked[n]:
+                continue
+            if g_score[n] < 0 or tentative < g_score[n]:
+                g_score[n] = tentative
+                came_from[n] = node
+                f = tentative + abs(nr - gr) + abs(nc - gc)
+                heapq.heappush(open_heap, (f << f_shift) | (tentative << node_bits) | n)
+            elif tentative == g_score[n] and trail[node] < trail[came_from[n]]:
+                came_from[n] = node
+    return None
 
 class ImprovedSShapePathPlanner:
     """
@@ -31,12 +116,41 @@ class ImprovedSShapePathPlanner:
     def __init__(self, warehouse_matrix: np.ndarray):
         self.wm = warehouse_matrix
         self.rows, self.cols = warehouse_matrix.shape
+        # 可通行格 (代號 0, 4, 5, 6, 7) 的布林地圖，A* 展開時直接查表
+        self.walkable: np.ndarray = ((warehouse_matrix == 0) | (warehouse_matrix == 4) | (warehouse_matrix == 5)
+                                     | (warehouse_matrix == 6) | (warehouse_matrix == 7))
+        # 靜態不可通行格的扁平點陣 (索引為 r * cols + c)，每次搜尋複製後再疊上動態障礙物與禁止區域
+        self._static_blocked: bytes = (~self.walkable).astype(np.uint8).tobytes()
+        # 每格唯一的座標元組，以扁平編號索引；路徑與訪問點一律取用同一物件，不再重複配置
+        self._coord_pool: List[Coord] = [divmod(i, self.cols) for i in range(self.rows * self.cols)]
+        # 各區的入口候選點 (主幹道上的走道格)，順序與逐格掃描一致
+        self._entry_upper: List[Coord] = [(ry, int(x)) for ry in (1, 6) if ry < self.rows
+                                          for x in np.flatnonzero(warehouse_matrix[ry] == 0)]
+        self._entry_lower: List[Coord] = [(ry, int(x)) for ry in (7, 12) if ry < self.rows
+                                          for x in np.flatnonzero(warehouse_matrix[ry] == 0)]
+        self._entry_upper_arr = np.array(self._entry_upper, dtype=np.int64).reshape(-1, 2)
+        self._entry_lower_arr = np.array(self._entry_lower, dtype=np.int64).reshape(-1, 2)
         self.current_items: List[Coord] = []
         self.visited: Set[Coord] = set()
+        self._remaining = 0  # 尚未訪問的貨物數，由 mark_visited 遞減
+        # 貨物陣列 (N×2) 及其扁平格位編號，供區域篩選與掃描向量化使用
+        self._items_arr: np.ndarray = np.empty((0, 2), dtype=np.int16)
+        self._item_ids: np.ndarray = np.zeros(0, dtype=np.intp)
+        # 已訪問格位的點陣 (索引為 r * cols + c)；visited 集合只留作最終報告
+        self._visited_bitmap: np.ndarray = np.zeros(self.rows * self.cols, dtype=np.uint8)
         self.touch_count = 0
         self.zone = None
         self.start_zone = None
         self.zone_sequence = []
+        self.clear_caches()
+
+    def clear_caches(self):
+        """清除規劃器內的訪問點、中繼點與 A* 路徑快取。"""
+        # 貨物 -> (訪問點, {'upper': 中繼點, 'lower': 中繼點})
+        self._nav_cache: Dict[Coord, Tuple[List[Coord], Dict[str, List[Coord]]]] = {}
+        # (start, goal, 障礙物鍵) -> A* 結果 (含 None)
+        self._path_cache: Dict[Tuple[Coord, Coord, tuple], Optional[List[Coord]]] = {}
+        self._obstacle_key: tuple = ()
 
     def determine_zone(self, pos: Coord) -> str:
         """根據 Y 座標判斷所在區域 (上半部/下半部)。"""
@@ -49,62 +163,112 @@ class ImprovedSShapePathPlanner:
         else:
             return 'left' if zone == 'lower' else 'right'
 
-    def items_in_zone(self, zone: str = None) -> List[Coord]:
-        """取得指定區域內所有未訪問的貨物。"""
+    def items_in_zone(self, zone: str = None) -> np.ndarray:
+        """取得指定區域內所有未訪問的貨物 (N×2 陣列，保持原始順序)。"""
         if zone is None:
             zone = self.zone
-        if zone == 'upper':
-            return [i for i in self.current_items if i not in self.visited and i[0] <= 6]
-        else:
-            return [i for i in self.current_items if i not in self.visited and i[0] >= 7]
+        item_rows = self._items_arr[:, 0]
+        in_zone = item_rows <= 6 if zone == 'upper' else item_rows >= 7
+        return self._items_arr[in_zone & (self._visited_bitmap[self._item_ids] == 0)]
 
-    def scan_next(self, cur_x: int, items: List[Coord], dir: str) -> Optional[Coord]:
+    def scan_next(self, cur_x: int, items: np.ndarray, dir: str) -> Optional[Coord]:
         """根據掃描方向，從候選貨物中找出下一個目標。"""
-        if not items:
+        if len(items) == 0:
             return None
+        item_cols = items[:, 1]
         if dir == 'left':
-            cands = [i for i in items if i[1] <= cur_x]
-            return max(cands, key=lambda i: i[1]) if cands else None
+            cand_idx = np.flatnonzero(item_cols <= cur_x)
+            if len(cand_idx) == 0:
+                return None
+            pick = cand_idx[item_cols[cand_idx].argmax()]
         else:
-            cands = [i for i in items if i[1] >= cur_x]
-            return min(cands, key=lambda i: i[1]) if cands else None
-
-    def gen_access(self, item: Coord) -> List[Coord]:
-        """生成貨物的可訪問點 (相鄰的走道)。"""
+            cand_idx = np.flatnonzero(item_cols >= cur_x)
+            if len(cand_idx) == 0:
+                return None
+            pick = cand_idx[item_cols[cand_idx].argmin()]
+        r, c = items[pick].tolist()
+        return self._c(r, c)
+
+    def mark_visited(self, item: Coord):
+        """標記貨物為已訪問，同步更新點陣 (重複出現的同一貨物自然一併標記)。"""
+        if item not in self.visited:
+            self.visited.add(item)
+            self._remaining -= 1
+        self._visited_bitmap[self._idx(*item)] = 1
+
+    def is_visited(self, item: Coord) -> bool:
+        """檢查貨物是否已訪問。"""
+        return bool(self._visited_bitmap[self._idx(*item)])
+
+    def _idx(self, r: int, c: int) -> int:
+        """座標轉為扁平格位編號。"""
+        return r * self.cols + c
+
+    def _c(self, r: int, c: int) -> Coord:
+        """取得 (r, c) 在座標池中的共用元組。"""
+        return self._coord_pool[r * self.cols + c]
+
+    def _rasterize(self, dyn: Optional[List[Coord]], forbid: Optional[Set[Coord]]) -> bytearray:
+        """以靜態不可通行點陣為底，疊上動態障礙物與禁止區域，得到單一的扁平封鎖點陣；界外座標忽略。"""
+        rows, cols = self.rows, self.cols
+        blocked = bytearray(self._static_blocked)
+        for r, c in itertools.chain(dyn or (), forbid or ()):
+            if 0 <= r < rows and 0 <= c < cols:
+                blocked[r * cols + c] = 1
+        return blocked
+
+    def _access_and_relays(self, item: Coord) -> Tuple[List[Coord], Dict[str, List[Coord]]]:
+        """
+        一次算出貨物的訪問點與上下半區中繼點。
+        候選最多 4 個，以線性掃描去重即可，不另建 set。
+        """
+        cached = self._nav_cache.get(item)
+        if cached is not None:
+            return cached
+        wm = self.wm
         r, c = item
         aps = []
         for dc in (-1, 1):
             nc = c + dc
-            if 0 <= nc < self.cols and self.wm[r, nc] == 0:
-                aps.append((r, nc))
+            if 0 <= nc < self.cols and wm[r, nc] == 0:
+                aps.append(self._c(r, nc))
         if not aps:
             for dr in (-1, 1):
                 nr = r + dr
-                if 0 <= nr < self.rows and self.wm[nr, c] == 0:
-                    aps.append((nr, c))
-        return aps
-
-    def gen_relays_for(self, item: Coord) -> Dict[str, List[Coord]]:
-        """為貨物生成位於主幹道的中繼點。"""
-        aps = self.gen_access(item)
-        groups = {'upper': [], 'lower': []}
+                if 0 <= nr < self.rows and wm[nr, c] == 0:
+                    aps.append(self._c(nr, c))
+        upper: List[Coord] = []
+        lower: List[Coord] = []
         for ay, ax in aps:
             if 1 <= ay <= 6:
-                for ry in (1, 6):
-                    if self.wm[ry, ax] == 0:
-                        groups['upper'].append((ry, ax))
+                seen, relay_rows = upper, (1, 6)
             elif 7 <= ay <= 12:
-                for ry in (7, 12):
-                    if self.wm[ry, ax] == 0:
-                        groups['lower'].append((ry, ax))
-        groups['upper'] = list(set(groups['upper']))
-        groups['lower'] = list(set(groups['lower']))
-        return groups
+                seen, relay_rows = lower, (7, 12)
+            else:
+                continue
+            for ry in relay_rows:
+                if wm[ry, ax] == 0:
+                    relay = self._c(ry, ax)
+                    if relay not in seen:
+                        seen.append(relay)
+        result = (aps, {'upper': upper, 'lower': lower})
+        self._nav_cache[item] = result
+        return result
+
+    def gen_access(self, item: Coord) -> List[Coord]:
+        """生成貨物的可訪問點 (相鄰的走道)。"""
+        return self._access_and_relays(item)[0]
+
+    def gen_relays_for(self, item: Coord) -> Dict[str, List[Coord]]:
+        """為貨物生成位於主幹道的中繼點。"""
+        return self._access_and_relays(item)[1]
 
     def get_zone_entry_point(self, target_zone: str, from_pos: Coord) -> Optional[Coord]:
         """計算進入目標區域的最佳入口點。"""
-        relay_rows = [7, 12] if target_zone == 'lower' else [1, 6]
-        candidates = [(ry, x) for ry in relay_rows for x in range(self.cols) if self.wm[ry, x] == 0]
+        if target_zone == 'lower':
+            candidates, cand_arr = self._entry_lower, self._entry_lower_arr
+        else:
+            candidates, cand_arr = self._entry_upper, self._entry_upper_arr
         if not candidates:
             return None
         # 根據起始區和目標區決定入口選擇邏輯，確保S形路徑
@@ -112,11 +276,24 @@ class ImprovedSShapePathPlanner:
             return min(candidates, key=lambda p: (p[0], p[1]))
         elif self.start_zone == 'lower' and target_zone == 'upper':
             return min(candidates, key=lambda p: (-p[0], p[1]))
-        return self.nearest(from_pos, candidates)
+        return candidates[self._nearest_index(from_pos, cand_arr)]
+
+    def nearest(self, pos: Coord, pts) -> Optional[Coord]:
+        """從列表 (或 N×2 陣列) 中找出距離給定點最近的點。"""
+        if isinstance(pts, np.ndarray):
+            return self._nearest_arr(pos, pts) if len(pts) else None
+        return min(pts, key=lambda p: _sqdist(pos, p)) if pts else None
 
-    def nearest(self, pos: Coord, pts: List[Coord]) -> Optional[Coord]:
-        """從列表中找出距離給定點最近的點。"""
-        return min(pts, key=lambda p: euclidean_distance(pos, p)) if pts else None
+    @staticmethod
+    def _nearest_index(pos: Coord, arr: np.ndarray) -> int:
+        """以距離平方 (免開根號) 向量化找出最近點的索引，同距離時取較前者。"""
+        diff = arr - np.asarray(pos, dtype=arr.dtype)
+        return int(np.argmin((diff * diff).sum(axis=1)))
+
+    def _nearest_arr(self, pos: Coord, arr: np.ndarray) -> Coord:
+        """_nearest_index 的座標版本。"""
+        r, c = arr[self._nearest_index(pos, arr)].tolist()
+        return self._c(r, c)
 
     def paired(self, relay: Coord) -> Optional[Coord]:
         """找到主幹道上與給定中繼點配對的另一個中繼點。"""
@@ -124,9 +301,49 @@ class ImprovedSShapePathPlanner:
         py = {1: 6, 6: 1, 7: 12, 12: 7}.get(ry)
         return (py, rx) if py and self.wm[py, rx] == 0 else None
 
+    def astar(self, start: Coord, goal: Coord,
+              dyn: Optional[List[Coord]] = None,
+              forbid: Optional[Set[Coord]] = None) -> Optional[List[Coord]]:
+        """
+        規劃器內部使用的 A*，行為與 routing.plan_route 相同：
+        返回從「下一步」到終點的路徑，起點即終點時為空列表，無路徑時為 None。
+        實際搜尋交給扁平化網格上的 `_astar_flat`，此處只負責遮罩與座標轉換。
+        """
+        rows, cols = self.rows, self.cols
+        blocked = self._rasterize(dyn, forbid)
+        nodes = _astar_flat(blocked, start[0], start[1], goal[0], goal[1], rows, cols)
+        if nodes is None:
+            return None
+        pool = self._coord_pool
+        return [pool[node] for node in nodes]
+
+    def cached_astar(self, start: Coord, goal: Coord,
+                     dyn: Optional[List[Coord]] = None,
+                     forbid: Optional[Set[Coord]] = None) -> Optional[List[Coord]]:
+        """
+        以 (start, goal, 障礙物鍵) 快取 astar 結果。
+        障礙物鍵由 execute_items_only 每次呼叫時計算一次，dyn 或 forbid 不同時不會共用結果。
+        """
+        key = (start, goal, self._obstacle_key)
+        if key in self._path_cache:
+            return self._path_cache[key]
+        seg = self.astar(start, goal, dyn, forbid)
+        self._path_cache[key] = seg
+        return seg
+
+    def _multi_goal_search(self, start: Coord, goal_set: Set[Coord],
+                           dyn: Optional[List[Coord]] = None,
+                           forbid: Optional[Set[Coord]] = None) -> Dict[Coord, Optional[List[Coord]]]:
+        """
+        一次取得同一起點到多個終點的路徑，逐一經由 cached_astar 求解並共用其快取。
+        各路段與單獨呼叫 astar 的結果相同，整條路線與基礎 A* 版本一致。
+        返回 {終點: 路徑}，路徑格式同 astar (無路徑時為 None)。
+        """
+        return {goal: self.cached_astar(start, goal, dyn, forbid) for goal in goal_set}
+
     def check_all_items_visited(self) -> bool:
         """檢查是否所有貨物都已被訪問。"""
-        return len(self.visited) >= len(self.current_items)
+        return self._remaining <= 0
 
     def execute_items_only(self, start: Coord, items: List[Coord],
                            dyn: Optional[List[Coord]] = None,
@@ -134,9 +351,16 @@ class ImprovedSShapePathPlanner:
         """
         執行完整的多點撿貨路徑規劃，返回包含所有步驟的完整路徑。
         """
-        print(f"=== 改進的 S-Shape 開始 (起始位置: {start}) ===")
+        debug = _log.isEnabledFor(logging.DEBUG)
+        if debug:
+            _log.debug("=== 改進的 S-Shape 開始 (起始位置: %s) ===", start)
         self.current_items = items
+        self._items_arr = np.array(items, dtype=np.int16).reshape(-1, 2)
+        self._item_ids = self._items_arr[:, 0].astype(np.intp) * self.cols + self._items_arr[:, 1]
+        self._visited_bitmap[:] = 0
+        self._obstacle_key = (frozenset(dyn) if dyn else frozenset(), frozenset(forbid) if forbid else frozenset())
         self.visited.clear()
+        self._remaining = len(items)  # 與 len(current_items) - len(visited) 同步
         self.touch_count = 0
         pos = start
         path: List[Coord] = [start] # 路徑應包含起點
@@ -145,33 +369,39 @@ class ImprovedSShapePathPlanner:
         self.start_zone = self.zone
         self.zone_sequence = [self.zone]
 
-        print(f" 起始區域: {self.start_zone}")
-        print(f" 待揀貨物分布: 上半區 {len(self.items_in_zone('upper'))} 個, 下半區 {len(self.items_in_zone('lower'))} 個")
+        if debug:
+            _log.debug("起始區域: %s", self.start_zone)
+            _log.debug("待揀貨物分布: 上半區 %d 個, 下半區 %d 個", len(self.items_in_zone('upper')), len(self.items_in_zone('lower')))
 
         while not self.check_all_items_visited():
             zone_items = self.items_in_zone()
-            if not zone_items:
+            if len(zone_items) == 0:
                 other_zone = 'upper' if self.zone == 'lower' else 'lower'
-                if not self.items_in_zone(other_zone):
-                    print(" 所有貨物已在規劃中，結束路徑生成。")
+                if len(self.items_in_zone(other_zone)) == 0:
+                    if debug:
+                        _log.debug("所有貨物已在規劃中，結束路徑生成。")
                     break
                 
-                print(f"🔄 切換區域: {self.zone} -> {other_zone}")
+                if debug:
+                    _log.debug("🔄 切換區域: %s -> %s", self.zone, other_zone)
                 entry_point = self.get_zone_entry_point(other_zone, pos)
                 if not entry_point:
-                    print(f" 找不到進入 {other_zone} 區域的入口點，路徑規劃終止。")
+                    if debug:
+                        _log.debug("找不到進入 %s 區域的入口點，路徑規劃終止。", other_zone)
                     return None # 嚴重錯誤，無法繼續
                 
-                seg = plan_route_a_star(pos, entry_point, self.wm, dyn, forbid)
+                seg = self.cached_astar(pos, entry_point, dyn, forbid)
                 if seg:
                     path.extend(seg)
                     pos = entry_point
                     self.zone = other_zone
                     self.zone_sequence.append(self.zone)
                     self.touch_count = 0
-                    print(f" 已進入 {other_zone} 區域，入口點: {entry_point}")
+                    if debug:
+                        _log.debug("已進入 %s 區域，入口點: %s", other_zone, entry_point)
                 else:
-                    print(f" 無法導航至 {other_zone} 區域入口點，路徑規劃終止。")
+                    if debug:
+                        _log.debug("無法導航至 %s 區域入口點，路徑規劃終止。", other_zone)
                     return None # 嚴重錯誤
                 continue
 
@@ -183,74 +413,88 @@ class ImprovedSShapePathPlanner:
                 nxt = self.scan_next(pos[1], zone_items, direction)
                 if not nxt:
                     # 如果雙向都掃描不到，代表此區域已完成
-                    self.visited.update(zone_items)
+                    for r, c in zone_items.tolist():
+                        self.mark_visited((r, c))
                     continue
 
-            same_aisle_items = sorted([i for i in zone_items if i[1] == nxt[1]], key=lambda p: p[0])
+            aisle_arr = zone_items[zone_items[:, 1] == nxt[1]]
+            aisle_arr = aisle_arr[np.argsort(aisle_arr[:, 0], kind='stable')]
+            same_aisle_items = [self._c(r, c) for r, c in aisle_arr.tolist()]
 
             for item in same_aisle_items:
-                if item in self.visited:
+                if self.is_visited(item):
                     continue
 
-                print(f" 處理目標: {item} (掃描方向: {direction})")
-                relays = self.gen_relays_for(item)[self.zone]
-                aps = self.gen_access(item)
+                if debug:
+                    _log.debug("處理目標: %s (掃描方向: %s)", item, direction)
+                aps, relay_groups = self._access_and_relays(item)
+                relays = relay_groups[self.zone]
 
                 if not relays or not aps:
-                    print(f" 無法為 {item} 生成導航點，標記為已訪問並跳過。")
-                    self.visited.add(item)
+                    if debug:
+                        _log.debug("無法為 %s 生成導航點，標記為已訪問並跳過。", item)
+                    self.mark_visited(item)
                     continue
 
                 rlay = self.nearest(pos, relays)
                 ap = self.nearest(pos, aps)
 
-                seg_to_relay = plan_route_a_star(pos, rlay, self.wm, dyn, forbid)
+                seg_to_relay = self.cached_astar(pos, rlay, dyn, forbid)
                 if not seg_to_relay:
-                    print(f" 無法找到到達中繼點 {rlay} 的路徑，跳過 {item}。")
-                    self.visited.add(item)
+                    if debug:
+                        _log.debug("無法找到到達中繼點 %s 的路徑，跳過 %s。", rlay, item)
+                    self.mark_visited(item)
                     continue
                 
                 path.extend(seg_to_relay)
                 pos = rlay
                 self.touch_count += 1
 
-                # 核心S-Shape邏輯：在主幹道間移動並訪問貨物
+                # 自中繼點出發的橫穿段與取貨段一併查詢，共用路段快取
                 paired_relay = self.paired(rlay)
-                if self.touch_count % 2 == 1 and paired_relay:
-                    seg_across = plan_route_a_star(pos, paired_relay, self.wm, dyn, forbid)
+                crossing = self.touch_count % 2 == 1 and paired_relay
+                from_relay = self._multi_goal_search(pos, {ap, paired_relay} if crossing else {ap}, dyn, forbid)
+
+                # 核心S-Shape邏輯：在主幹道間移動並訪問貨物
+                if crossing:
+                    seg_across = from_relay[paired_relay]
                     if seg_across:
-                        # 檢查訪問點是否在橫穿路徑上
-                        try:
-                            idx = seg_across.index(ap)
-                            path.extend(seg_across[:idx+1])
+                        # 檢查訪問點是否在橫穿路徑上 (-1 表示不在)
+                        idx = next((i for i, node in enumerate(seg_across) if node == ap), -1)
+                        if idx >= 0:
+                            path.extend(itertools.islice(seg_across, idx + 1))
                             pos = ap
-                            self.visited.add(item)
-                            print(f" 已揀取: {item} (在橫穿路徑上)")
+                            self.mark_visited(item)
+                            if debug:
+                                _log.debug("已揀取: %s (在橫穿路徑上)", item)
                             # 繼續路徑的剩餘部分
                             if idx + 1 < len(seg_across):
-                                path.extend(seg_across[idx+1:])
+                                path.extend(itertools.islice(seg_across, idx + 1, None))
                                 pos = paired_relay
-                        except ValueError:
+                        else:
                             # 不在路徑上，先走完再訪問
                             path.extend(seg_across)
                             pos = paired_relay
                 
                 # 如果貨物還沒被訪問，規劃從當前位置到訪問點的路徑
-                if item not in self.visited:
-                    seg_to_ap = plan_route_a_star(pos, ap, self.wm, dyn, forbid)
+                if not self.is_visited(item):
+                    seg_to_ap = from_relay[ap] if pos == rlay else self.cached_astar(pos, ap, dyn, forbid)
                     if seg_to_ap:
                         path.extend(seg_to_ap)
                         pos = ap
-                        self.visited.add(item)
-                        print(f" 已揀取: {item}")
+                        self.mark_visited(item)
+                        if debug:
+                            _log.debug("已揀取: %s", item)
                     else:
-                        print(f" 無法從 {pos} 導航至 {item} 的訪問點 {ap}，跳過。")
-                        self.visited.add(item) # 標記為已訪問避免死循環
-
-        print(f"=== S-Shape 結束 ===")
-        print(f" 訪問 {len(self.visited)}/{len(self.current_items)} 個貨物")
-        print(f" 最終位置: {pos}")
-        print(f" 路徑總長度: {len(path)} 步")
+                        if debug:
+                            _log.debug("無法從 %s 導航至 %s 的訪問點 %s，跳過。", pos, item, ap)
+                        self.mark_visited(item) # 標記為已訪問避免死循環
+
+        if debug:
+            _log.debug("=== S-Shape 結束 ===")
+            _log.debug("訪問 %d/%d 個貨物", len(self.visited), len(self.current_items))
+            _log.debug("最終位置: %s", pos)
+            _log.debug("路徑總長度: %d 步", len(path))
         return path
 
 
@@ -262,55 +506,48 @@ def plan_route(start_pos, target_pos, warehouse_matrix, dynamic_obstacles: Optio
     此函式為系統的統一入口點，它會根據 `cost_map` 的內容決定是否啟用
     改良式 S-Shape 演算法。
     """
-    print(f"  改良式 S-Shape 策略處理中: {start_pos} -> {target_pos}")
+    debug = _log.isEnabledFor(logging.DEBUG)
+    if debug:
+        _log.debug("改良式 S-Shape 策略處理中: %s -> %s", start_pos, target_pos)
     
     if cost_map and 's_shape_picks' in cost_map and len(cost_map['s_shape_picks']) > 1:
         pick_locations = cost_map['s_shape_picks']
-        print(f" 啟用改良式 S-Shape 策略，共 {len(pick_locations)} 個撿貨點。")
-        
-        planner = ImprovedSShapePathPlanner(warehouse_matrix)
-        
-        # 使用元組作為快取鍵，因為列表不可哈希
-        cache_key = (tuple(sorted(map(tuple, pick_locations))), start_pos)
+        if debug:
+            _log.debug("啟用改良式 S-Shape 策略，共 %d 個撿貨點。", len(pick_locations))
         
-        if cache_key in _s_shape_cache:
-            full_path = _s_shape_cache[cache_key]
-            print(" 從快取中讀取完整路徑。")
-        else:
-            full_path = planner.execute_items_only(start_pos, pick_locations, dynamic_obstacles, forbidden_cells)
-            if full_path:
-                _s_shape_cache[cache_key] = full_path
-                print(" 新的完整路徑已計算並快取。")
-            else:
-                print(" 改良式 S-Shape 策略無法生成完整路徑。")
-
-        if not full_path:
-            print(" S-Shape 策略無路徑，回退至標準 A* 演算法。")
+        # 使用元組與 frozenset 作為快取鍵，因為列表與集合不可哈希
+        cached = _cached_s_shape(warehouse_matrix.tobytes(), warehouse_matrix.shape, warehouse_matrix.dtype.str,
+                                    tuple(start_pos), tuple(map(tuple, pick_locations)),
+                                    frozenset(dynamic_obstacles) if dynamic_obstacles else frozenset(),
+                                    frozenset(forbidden_cells) if forbidden_cells else frozenset())
+        if cached is None:
+            if debug:
+                _log.debug("S-Shape 策略無路徑，回退至標準 A* 演算法。")
             return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
 
-        try:
-            # 確保 start_pos 在路徑的最前端
-            if full_path[0] != start_pos:
-                 print(f"警告: 完整路徑的起點 {full_path[0]} 與請求的起點 {start_pos} 不符。")
-                 # 這是預期行為，因為路徑是從機器人當前位置開始的
-            
-            start_idx = 0 # 完整路徑總是從 start_pos 開始
-
-            # 找到目標點在路徑中的索引
-            if target_pos in full_path:
-                end_idx = full_path.index(target_pos)
-                # 返回從下一步到目標點的路徑片段
-                result_path = full_path[start_idx + 1 : end_idx + 1]
-                print(f"📍 返回 S-Shape 路徑片段，共 {len(result_path)} 步。")
-                return result_path if result_path else None
-            else:
-                print(f" 目標點 {target_pos} 不在計算出的 S-Shape 路徑中，回退至標準 A*。")
-                return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
-        
-        except ValueError:
-            print(f" 處理路徑時發生錯誤，回退至標準 A*。")
+        full_path, idx_map = cached
+        # 確保 start_pos 在路徑的最前端
+        if full_path[0] != start_pos:
+             if debug:
+                 _log.debug("警告: 完整路徑的起點 %s 與請求的起點 %s 不符。", full_path[0], start_pos)
+             # 這是預期行為，因為路徑是從機器人當前位置開始的
+
+        start_idx = 0 # 完整路徑總是從 start_pos 開始
+
+        # 找到目標點在路徑中的索引
+        end_idx = idx_map.get(target_pos)
+        if end_idx is None:
+            if debug:
+                _log.debug("目標點 %s 不在計算出的 S-Shape 路徑中，回退至標準 A*。", target_pos)
             return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells)
-    
+
+        # 返回從下一步到目標點的路徑片段
+        result_path = list(full_path[start_idx + 1 : end_idx + 1])
+        if debug:
+            _log.debug("📍 返回 S-Shape 路徑片段，共 %d 步。", len(result_path))
+        return result_path if result_path else None
+
     # 如果不符合 S-Shape 策略的觸發條件，使用標準 A* 演算法
-    print(" 未觸發 S-Shape (單點任務或無指定撿貨點)，使用標準 A* 演算法。")
+    if debug:
+        _log.debug("未觸發 S-Shape (單點任務或無指定撿貨點)，使用標準 A* 演算法。")
     return plan_route_a_star(start_pos, target_pos, warehouse_matrix, dynamic_obstacles, forbidden_cells, cost_map)
\ No newline at end of file
@@ -15,3 +15,12 @@
 # 在此處填寫您想使用的路徑規劃模組的「檔案名稱」(不含 .py)。
 # 'routing': 預設的 A* 演算法實作。
 ROUTING_STRATEGY = 'routing'
+
+# --- 多點任務的 cost_map 鍵 ---
+# 支援多點撿貨的策略透過 cost_map 中的特定鍵取得完整撿貨點列表；
+# 任務分配 (taskmanager) 與後續路段規劃 (main) 共用此對照表。
+PICKS_COST_MAP_KEYS = {
+    'routing_m': 'composite_picks',
+    'routing_l': 'largest_gap_picks',
+    'routing_s': 's_shape_picks'
+}
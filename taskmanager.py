@@ -1,28 +1,45 @@
-import random
+import logging
+from dataclasses import dataclass
 from typing import List, Dict, Tuple, Optional, TYPE_CHECKING, Set
 import numpy as np
 
 # The routing function will be passed in, decoupling this module from a specific implementation.
 from robot_and_initial_state import Robot, RobotStatus, Coord, SIMULATION_CONFIG
+from strategy_config import PICKS_COST_MAP_KEYS
 
 if TYPE_CHECKING:
     pass
 # Type aliases
 Coord = Tuple[int, int]
-Task = Dict[str, any]
+
+@dataclass(slots=True)
+class Task:
+    """
+    單一撿貨任務。以 slots 取代字典，減少每筆任務的記憶體並加快欄位存取。
+
+    :param task_id: 任務編號。
+    :param shelf_locations: 尚未撿取的貨架位置，依序撿取，撿完即移除。
+    :param original_locations: 任務生成時的完整貨架列表，供日誌記錄。
+    """
+    task_id: int
+    shelf_locations: List[Coord]
+    original_locations: List[Coord]
+
+# 診斷訊息走 logging；層級高於 DEBUG/INFO 時熱路徑不做字串格式化與 I/O
+_log = logging.getLogger(__name__)
 
 class TaskManager:
     """
     管理待處理的任務佇列，並根據需求生成新的隨機任務。
     它還負責將任務分配給最合適的可用機器人。
     """
-    def __init__(self, warehouse_matrix: np.ndarray):
+    def __init__(self, warehouse_matrix: np.ndarray, seed: Optional[int] = None):
         self.task_queue: List[Task] = []
         self.next_task_id: int = 1
-        # 從倉庫佈局中提取所有貨架的座標，用於生成隨機任務
-        self.shelf_coords: List[Coord] = [
-            tuple(coord) for coord in np.argwhere(warehouse_matrix == 1)
-        ]
+        # 從倉庫佈局中提取所有貨架的座標 (N×2 int32 陣列)，用於生成隨機任務
+        self.shelf_coords: np.ndarray = np.argwhere(warehouse_matrix == 1).astype(np.int32)
+        # 任務生成專用的亂數產生器；指定 seed 時任務序列可重現
+        self.rng = np.random.default_rng(seed)
 
     def generate_random_task(self) -> Optional[Task]:
         """
@@ -32,26 +49,29 @@ class TaskManager:
         :return: 生成的任務字典，如果沒有可用貨架則返回 None。
         """
         min_loc, max_loc = SIMULATION_CONFIG.get("task_locations_range", (1, 1))
-        num_locations = random.randint(min_loc, max_loc)
+        num_locations = int(self.rng.integers(min_loc, max_loc, endpoint=True))
 
-        if not self.shelf_coords or len(self.shelf_coords) < num_locations:
-            print("警告: 倉庫中沒有貨架可供生成任務。")
+        num_shelves = self.shelf_coords.shape[0]
+        if num_shelves == 0 or num_shelves < num_locations:
+            _log.warning("倉庫中沒有貨架可供生成任務。")
             return None
 
-        # 隨機選擇不重複的多個貨架位置
-        shelf_locations = random.sample(self.shelf_coords, num_locations)
+        # 隨機選擇不重複的多個貨架位置 (只抽索引，再轉回座標元組供下游使用)
+        idx = self.rng.choice(num_shelves, size=num_locations, replace=False)
+        shelf_locations = [(r, c) for r, c in self.shelf_coords[idx].tolist()]
 
-        task = {
-            "task_id": self.next_task_id,
-            "shelf_locations": shelf_locations, # 現在是一個地點列表
-            "original_locations": list(shelf_locations) # 複製一份原始列表以供日誌記錄
-        }
+        task = Task(
+            task_id=self.next_task_id,
+            shelf_locations=shelf_locations, # 現在是一個地點列表
+            original_locations=list(shelf_locations) # 複製一份原始列表以供日誌記錄
+        )
         self.task_queue.append(task)
         self.next_task_id += 1
         
-        # 格式化輸出，使其更易讀
-        locations_str = ', '.join(map(str, shelf_locations))
-        print(f" 已生成新任務 {task['task_id']} (共 {num_locations} 個點)，目標貨架: {locations_str}")
+        # 格式化輸出，使其更易讀；貨架列表字串只在 INFO 啟用時才組合
+        if _log.isEnabledFor(logging.INFO):
+            locations_str = ', '.join(map(str, shelf_locations))
+            _log.info("已生成新任務 %s (共 %d 個點)，目標貨架: %s", task.task_id, num_locations, locations_str)
         return task
 
     def assign_pending_tasks(self, robots: Dict[str, 'Robot'], warehouse_matrix: np.ndarray, plan_route_func, routing_strategy_name: str, forbidden_cells_for_tasks: Optional[Set[Coord]] = None):
@@ -69,57 +89,73 @@ class TaskManager:
             return
 
         # 找出所有閒置且電量充足的機器人
-        available_robots = [
-            r for r in robots.values() 
-            if r.status == RobotStatus.IDLE and r.battery_level > r.charging_threshold
+        # robots 內皆為 Robot 物件，直接讀取屬性，不逐一做 hasattr 檢查；Enum 成員以 is 比較
+        idle_robots = [
+            r for r in robots.values()
+            if r.status is RobotStatus.IDLE and r.battery_level > r.charging_threshold
         ]
         
-        if not available_robots:
+        if not idle_robots:
             return # 沒有可用的機器人
 
-        # 隨機打亂機器人順序，避免每次都分配給同一個機器人 (例如 R1)
-        random.shuffle(available_robots)
-
-        unassigned_tasks = []
-        # 遍歷任務佇列中的每一項任務
-        for task in self.task_queue:
-            # 如果還有可用的機器人
-            if available_robots:
-                # 取出一個可用的機器人來分配任務
-                robot_to_assign = available_robots.pop(0)
-                # 規劃到任務列表中的第一個貨架
-                target_pos = task["shelf_locations"][0]
-                
-                # --- 策略性 cost_map 準備 ---
-                # 為了讓多點路徑規劃策略 (如 routing_m) 能正常運作，
-                # 我們需要根據策略名稱，將完整的撿貨點列表放入 cost_map。
-                cost_map = {}
-                if len(task["shelf_locations"]) > 1:
-                    strategy_key_map = {
-                        'routing_m': 'composite_picks',
-                        'routing_l': 'largest_gap_picks',
-                        'routing_s': 's_shape_picks'
-                    }
-                    if routing_strategy_name in strategy_key_map:
-                        key = strategy_key_map[routing_strategy_name]
-                        cost_map[key] = task['shelf_locations']
-                
-                path = plan_route_func(robot_to_assign.position, target_pos, warehouse_matrix, forbidden_cells=forbidden_cells_for_tasks, cost_map=cost_map)
-                
-                if path:
-                    # 如果路徑規劃成功，則分配任務
-                    robot_to_assign.assign_task(task, path)
-                else:
-                    # 如果路徑規劃失敗，將機器人和任務都放回待處理列表
-                    print(f"無法為機器人 {robot_to_assign.id} 規劃到任務 {task['task_id']} 的路徑。")
-                    available_robots.append(robot_to_assign) # 將機器人放回可用列表的末尾
-                    unassigned_tasks.append(task)
+        # 隨機打亂機器人順序，距離相同時不會總是分配給同一個機器人 (例如 R1)；
+        # 以 self.rng 抽整數排列，與任務生成共用同一個可重現的亂數來源
+        if len(idle_robots) > 1:
+            idle_robots = [idle_robots[i] for i in self.rng.permutation(len(idle_robots)).tolist()]
+
+        # --- 成本矩陣與指派 ---
+        # 以 (機器人, 任務第一個貨架) 的曼哈頓距離作為路徑長度下界，一次向量化算出整張矩陣，
+        # 再由小到大貪婪配對，只對選中的配對呼叫 plan_route_func。
+        # 這是貪婪近似，並非最佳指派；每個任務每個 tick 至多規劃一次，總規劃次數不超過閒置機器人數。
+        robot_pos = np.array([r.position for r in idle_robots], dtype=np.int32).reshape(-1, 2)
+        task_pos = np.array([t.shelf_locations[0] for t in self.task_queue], dtype=np.int32).reshape(-1, 2)
+        cost = (np.abs(robot_pos[:, None, 0] - task_pos[None, :, 0])
+                + np.abs(robot_pos[:, None, 1] - task_pos[None, :, 1]))
+        num_tasks = len(self.task_queue)
+        # 多點任務要放入 cost_map 的鍵只取決於策略名稱，每次分配只查一次
+        picks_key = PICKS_COST_MAP_KEYS.get(routing_strategy_name)
+
+        robot_free = [True] * len(idle_robots)
+        task_assigned = [False] * num_tasks
+        task_tried = [False] * num_tasks  # 本 tick 已規劃過 (成功或失敗) 的任務
+        robots_left = len(idle_robots)
+        tasks_left = num_tasks
+        attempts_left = len(idle_robots)
+        for flat_idx in np.argsort(cost, axis=None, kind='stable').tolist():
+            if robots_left == 0 or tasks_left == 0 or attempts_left == 0:
+                break
+            ri, ti = divmod(flat_idx, num_tasks)
+            if not robot_free[ri] or task_tried[ti]:
+                continue
+            task_tried[ti] = True
+            tasks_left -= 1
+            attempts_left -= 1
+            robot_to_assign = idle_robots[ri]
+            task = self.task_queue[ti]
+            # 規劃到任務列表中的第一個貨架
+            target_pos = task.shelf_locations[0]
+
+            # --- 策略性 cost_map 準備 ---
+            # 為了讓多點路徑規劃策略 (如 routing_m) 能正常運作，
+            # 我們需要根據策略名稱，將完整的撿貨點列表放入 cost_map。
+            cost_map = {}
+            if picks_key is not None and len(task.shelf_locations) > 1:
+                cost_map[picks_key] = task.shelf_locations
+
+            path = plan_route_func(robot_to_assign.position, target_pos, warehouse_matrix, forbidden_cells=forbidden_cells_for_tasks, cost_map=cost_map)
+
+            if path:
+                # 如果路徑規劃成功，則分配任務
+                robot_to_assign.assign_task(task, path)
+                robot_free[ri] = False
+                task_assigned[ti] = True
+                robots_left -= 1
             else:
-                # 如果沒有可用的機器人了，保留剩餘的任務
-                unassigned_tasks.append(task)
-        
-        # 更新任務佇列，只保留未被分配的任務
-        self.task_queue = unassigned_tasks
+                # 如果路徑規劃失敗，任務留在佇列中等下一個 tick 再試；機器人仍可配對其他任務
+                _log.debug("無法為機器人 %s 規劃到任務 %s 的路徑。", robot_to_assign.id, task.task_id)
+
+        # 更新任務佇列，只保留未被分配的任務 (維持原本順序)
+        self.task_queue = [t for t, done in zip(self.task_queue, task_assigned) if not done]
 
     def get_queue_size(self) -> int:
         """Return the number of unassigned tasks in the queue."""
@@ -1,46 +1,60 @@
 # visualization.py
 
 import matplotlib.pyplot as plt
-import matplotlib.patches as patches
+import matplotlib.colors as mcolors
 import numpy as np
 from typing import List, TYPE_CHECKING
+from warehouse_layout import COLOR_MAP, CELL_CODES
 
 
 if TYPE_CHECKING:
     from robot_and_initial_state import Robot
 
 class Visualizer:
-    def __init__(self, warehouse_matrix: np.ndarray, robots: List['Robot']):
+    def __init__(self, warehouse_matrix: np.ndarray, robots: List['Robot'], draw_every: int = 1):
         """
         Visualizer 初始化
         
-        :param warehouse_matrix: 2D numpy array (0=aisle, 1=shelf, 2=picking, 3=charge)
+        :param warehouse_matrix: 2D numpy array (0=aisle, 1=shelf, 2=picking, 3=charge)；內部轉為 int8 保存
         :param robots: Robot 物件的列表。
                        Robot 需有 .position, .charging_status, .battery_level, .charging_threshold 屬性。
+        :param draw_every: 每隔幾個時間步才實際重繪一次；設為 1 則每一步都繪製。
         """
-        self.matrix = warehouse_matrix
+        # 儲存格代號只有 0~7，以連續的 int8 保存，背景著色時的逐類遮罩掃描讀取量較 int64 少 8 倍
+        self.matrix = np.ascontiguousarray(warehouse_matrix, dtype=np.int8)
         self.robots = robots
+        self.draw_every = max(1, draw_every)
         self.fig, self.ax = plt.subplots(figsize=(12, 10))
 
-        # 統一定義顏色，方便管理
+        # 統一定義顏色，方便管理；儲存格顏色取自 warehouse_layout.COLOR_MAP (走道不著色，保持透明)
         self.colors = {
-            1: '#A5A5A5',            # 貨架 (shelf)
-            2: '#FF9800',            # 撿貨站 (picking)
-            3: '#2196F3',            # 充電站 (charge)
-            4: '#ADD8E6',            # 充電排隊區 (charge queue)
-            5: '#00008B',            # 充電出口 (charge exit)
-            6: '#FFFACD',            # 撿貨排隊區 (picking queue)
-            7: '#FFA500',            # 撿貨出口 (picking exit)
+            **{code: color for code, (color, _label) in COLOR_MAP.items() if code != CELL_CODES["aisle"]},
             'working': 'green',      # 工作中
             'low_battery': 'yellow', # 低電量
             'charging': 'red',       # 充電中 (機器人顏色)
             'laden_indicator': '#39FF14' # 搬貨指示器顏色 (亮綠色)
         }
 
+        # 靜態背景只繪製一次；機器人以兩組 scatter 與固定的文字物件呈現，每一幀只更新其位置與顏色
+        self._bg_artist = None
+        self._robot_scat = self.ax.scatter([], [], s=800, edgecolors='black', zorder=10)
+        self._laden_scat = self.ax.scatter([], [], s=100, marker='s', c=self.colors['laden_indicator'],
+                                           edgecolors='white', linewidths=0.5, zorder=10.5) # 在圓圈之上，文字之下
+        self._labels = [self.ax.text(0, 0, robot.id, ha='center', va='center', color='black',
+                                     fontsize=8, weight='bold', zorder=11) for robot in robots]
+
     def _draw_static_background(self):
         """繪製不會變動的倉儲背景 (只在需要時呼叫)。"""
         rows, cols = self.matrix.shape
 
+        # 將各類儲存格一次著色成 RGBA 影像 (走道等未定義顏色的格子保持透明)，以單一 imshow 取代逐格 Rectangle
+        rgba = np.zeros((rows, cols, 4))
+        for cell_type, color in self.colors.items():
+            if isinstance(cell_type, int):
+                rgba[self.matrix == cell_type] = mcolors.to_rgba(color)
+        self._bg_artist = self.ax.imshow(rgba, extent=(-0.5, cols - 0.5, rows - 0.5, -0.5),
+                                         aspect='auto', interpolation='nearest', zorder=0)
+
         # 設定座標軸和網格，Y軸反轉以匹配陣列索引
         self.ax.set_xlim(-0.5, cols - 0.5)
         self.ax.set_ylim(rows - 0.5, -0.5) # Invert y-axis
@@ -48,49 +62,34 @@ class Visualizer:
         self.ax.set_yticks(np.arange(rows + 1) - 0.5, minor=True)
         self.ax.grid(which="minor", color="lightgray", linestyle='-', linewidth=0.5)
 
-        # 繪製倉儲背景 (貨架, 撿貨站, 充電站)
-        for r in range(rows):
-            for c in range(cols):
-                cell_type = self.matrix[r, c]
-                if cell_type in self.colors:
-                    rect = patches.Rectangle((c - 0.5, r - 0.5), 1, 1, facecolor=self.colors[cell_type])
-                    self.ax.add_patch(rect)
-
     def _draw_dynamic_elements(self):
         """
-        繪製會變動的元素 (機器人)。
+        更新會變動的元素 (機器人)。
+        所有機器人的座標、顏色與搬貨狀態先收集成陣列，再一次寫入 scatter。
         """
-        for robot in self.robots:
+        num_robots = len(self.robots)
+        xs = np.empty(num_robots)
+        ys = np.empty(num_robots)
+        laden = np.zeros(num_robots, dtype=bool)
+        face_colors = []
+        for i, robot in enumerate(self.robots):
             row, col = robot.position
-            
+            xs[i], ys[i] = col, row
+            laden[i] = bool(robot.carrying_item) # 正在搬貨時，在圓圈中間加上一個小方塊
+
             if robot.charging_status:
-                color = self.colors['charging']      # 紅色：充電中
+                face_colors.append(self.colors['charging'])      # 紅色：充電中
             elif robot.battery_level <= robot.charging_threshold:
-                color = self.colors['low_battery']   # 黃色：低電量
+                face_colors.append(self.colors['low_battery'])   # 黃色：低電量
             else:
-                color = self.colors['working']       # 綠色：工作中
-
-            # 繪製代表機器人的主圓圈
-            circ = patches.Circle((col, row), 0.35, facecolor=color, edgecolor='black', zorder=10)
-            self.ax.add_patch(circ)
-
-            # 如果機器人正在搬貨，在中間加上一個小方塊
-            if robot.carrying_item:
-                square_size = 0.25
-                # 計算方塊的左下角座標，使其置中
-                square_x = col - square_size / 2
-                square_y = row - square_size / 2
-                laden_indicator = patches.Rectangle(
-                    (square_x, square_y), square_size, square_size, 
-                    facecolor=self.colors['laden_indicator'], 
-                    edgecolor='white',
-                    linewidth=0.5,
-                    zorder=10.5 # 確保在圓圈之上，文字之下
-                )
-                self.ax.add_patch(laden_indicator)
-
-            # 繪製機器人 ID 文字
-            self.ax.text(col, row, robot.id, ha='center', va='center', color='black', fontsize=8, weight='bold', zorder=11)
+                face_colors.append(self.colors['working'])       # 綠色：工作中
+
+            # 機器人 ID 文字只移動位置，不重新建立
+            self._labels[i].set_position((col, row))
+
+        self._robot_scat.set_offsets(np.column_stack((xs, ys)))
+        self._robot_scat.set_facecolors(face_colors)
+        self._laden_scat.set_offsets(np.column_stack((xs[laden], ys[laden])))
 
     def draw(self, sim_time: int, completed_tasks: int, target_tasks: int, system_load: str = ""):
         """
@@ -99,25 +98,32 @@ class Visualizer:
 
         --- 運作流程解說 ---
         這個函式就像是動畫的每一幀。每次被呼叫時，它會：
-        1. 清空舊畫面：把上一秒的內容全部擦掉。
-        2. 繪製新背景：畫上不會變的網格、貨架等。
-        3. 繪製新內容：根據最新的機器人位置和狀態，畫上新的機器人。
-        4. 更新標題：顯示最新的時間、任務進度和系統負載狀態。
-        5. 暫停刷新：告訴電腦「畫好了，請顯示出來」，然後立刻繼續下一幀。
+        1. 繪製背景：第一次呼叫時開啟互動模式，畫上不會變的網格、貨架等，之後沿用。
+        2. 更新機器人：根據最新的機器人位置和狀態，移動既有的機器人圖形。
+        3. 更新標題：顯示最新的時間、任務進度和系統負載狀態。
+        4. 刷新畫面：請後端在空閒時重繪並處理視窗事件，然後立刻繼續下一幀。
+
+        sim_time 不是 draw_every 的倍數時直接略過，不做任何繪圖。
         """
-        # 1. 清除畫布 (ax.clear()): 每次重繪前，清除上一影格的所有內容。
-        self.ax.clear()
-        # 2. 繪製靜態背景 (_draw_static_background): 繪製不會變動的元素，如貨架和網格。
-        self._draw_static_background()
-        # 3. 繪製動態元素 (_draw_dynamic_elements): 繪製會變動的元素，主要是機器人。
+        if sim_time % self.draw_every:
+            return
+        # 1. 繪製靜態背景 (_draw_static_background): 貨架和網格只在第一次繪製。
+        if self._bg_artist is None:
+            # 第一幀才開啟互動模式並顯示視窗，建立 Visualizer 本身不改動 pyplot 的全域狀態
+            plt.ion()
+            self.fig.show()
+            self._draw_static_background()
+        # 2. 更新動態元素 (_draw_dynamic_elements): 只改寫機器人圖形的位置與顏色。
         self._draw_dynamic_elements()
 
-        # 4. 更新標題: 顯示模擬時間、任務進度和新的「系統負載」狀態。
+        # 3. 更新標題: 顯示模擬時間、任務進度和新的「系統負載」狀態。
         title = f"Time: {sim_time}   |   Tasks: {completed_tasks}/{target_tasks}   |   System Load: {system_load}"
         self.ax.set_title(title, fontsize=14)
-        # 5. 暫停以刷新畫面 (plt.pause): 這是讓 matplotlib 處理繪圖事件並更新視窗的關鍵。
-        plt.pause(0.000000000001)  # 設為極小值可以讓動畫流暢運行，而不會有明顯的延遲。
+        # 4. 刷新畫面: draw_idle 讓後端合併重繪請求，flush_events 處理視窗事件，省去 plt.pause 的計時休眠。
+        self.fig.canvas.draw_idle()
+        self.fig.canvas.flush_events()
 
     def show(self):
         """在模擬結束後，呼叫此方法以保持最終視窗開啟。"""
+        plt.ioff()
         plt.show()
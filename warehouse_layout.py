@@ -1,3 +1,4 @@
+import functools
 import matplotlib.pyplot as plt
 import numpy as np
 import matplotlib.patches as mpatches
@@ -40,7 +41,36 @@ CELL_CODES = {
 VERTICAL_AISLES = [0, 1, 4, 7, 10, 13, 14]
 HORIZONTAL_AISLES = [0, 1, 6, 7, 12, 13]
 
+def _station_cell_writes() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """將 STATION_LAYOUT 展開成 (列, 行, 代號) 三個陣列，依站點、排隊區、出口的順序排列。"""
+    rows, cols, codes = [], [], []
+    for layout_key, station_list in STATION_LAYOUT.items():
+        station_type = "picking" if layout_key == "picking_stations" else "charge"
+        for station_info in station_list:
+            cells = [(station_info["pos"], CELL_CODES[station_type])]
+            cells += [(q, CELL_CODES[station_type + "_queue"]) for q in station_info["queue"]]
+            cells.append((station_info["exit"], CELL_CODES[station_type + "_exit"]))
+            for (r, c), code in cells:
+                rows.append(r)
+                cols.append(c)
+                codes.append(code)
+    return np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp), np.asarray(codes, dtype=np.int8)
+
+# 所有站點相關格子的寫入位置與代號，匯入時計算一次，建立佈局時以單次索引賦值寫入
+_STATION_ROWS, _STATION_COLS, _STATION_CODES = _station_cell_writes()
+
 # --- 視覺化顏色定義 (Single Source of Truth for Colors) ---
+# 為所有儲存格類型定義顏色和標籤
+COLOR_MAP = {
+    0: ('#FFFFFF', 'Aisle'), 1: ('#A5A5A5', 'Shelf'), 2: ('#FF9800', 'Picking Station'),
+    3: ('#2196F3', 'Charge Station'), 4: ('#ADD8E6', 'Charge Queue'), 5: ('#00008B', 'Charge Exit'),
+    6: ('#FFFACD', 'Picking Queue'), 7: ('#FFA500', 'Picking Exit')
+}
+
+# 根據 COLOR_MAP 創建 ListedColormap、BoundaryNorm 和圖例，匯入時建立一次供每次繪圖共用
+_CMAP = mcolors.ListedColormap([COLOR_MAP[code][0] for code in sorted(COLOR_MAP)])
+_NORM = mcolors.BoundaryNorm(np.arange(-0.5, 8.5, 1), _CMAP.N)
+_LEGEND_PATCHES = [mpatches.Patch(color=color, label=label) for _code, (color, label) in sorted(COLOR_MAP.items())]
 
 def create_warehouse_layout() -> Tuple[np.ndarray, ShelfDict]:
     """
@@ -56,7 +86,17 @@ def create_warehouse_layout() -> Tuple[np.ndarray, ShelfDict]:
            4=充電排隊區, 5=充電出口,
            6=撿貨排隊區, 7=撿貨出口)
         - shelf_levels_dict (dict): 一個將貨架座標映射到其儲存層級的字典。
+
+    佈局本身只建立一次並快取；每次呼叫返回矩陣副本與全新的貨架字典，呼叫端可自由修改。
     """
+    template, shelf_coords, shelf_levels = _layout_template()
+    warehouse_matrix = template.copy()
+    shelf_levels_dict = {coord: [[] for _ in range(shelf_levels)] for coord in shelf_coords}
+    return warehouse_matrix, shelf_levels_dict
+
+@functools.lru_cache(maxsize=1)
+def _layout_template() -> Tuple[np.ndarray, Tuple[Coord, ...], int]:
+    """建立佈局模板：(唯讀矩陣, 貨架座標, 貨架層數)。佈局固定，整個程式只計算一次。"""
     # --- 固定的倉儲配置 ---
     num_rows = 14
     num_cols = 15
@@ -64,28 +104,26 @@ def create_warehouse_layout() -> Tuple[np.ndarray, ShelfDict]:
 
     # --- 配置結束 ---
 
-    # 使用 numpy 的廣播功能更有效率地創建矩陣
-    warehouse_matrix = np.ones((num_rows, num_cols), dtype=int)
-    warehouse_matrix[HORIZONTAL_AISLES, :] = 0
-    warehouse_matrix[:, VERTICAL_AISLES] = 0
+    # 使用 numpy 的廣播功能更有效率地創建矩陣：不在任何走道上的列與行，其外積即為貨架
+    # 代號只有 0~7，以 int8 保存，掃描地圖時的讀取量較預設整數少 8 倍
+    shelf_rows = np.ones(num_rows, dtype=bool)
+    shelf_rows[HORIZONTAL_AISLES] = False
+    shelf_cols = np.ones(num_cols, dtype=bool)
+    shelf_cols[VERTICAL_AISLES] = False
+    warehouse_matrix = np.logical_and.outer(shelf_rows, shelf_cols).astype(np.int8)
 
-    # 使用字典推導式更有效率地創建貨架字典
-    shelf_coords = np.argwhere(warehouse_matrix == 1)
-    shelf_levels_dict = {tuple(coord): [[] for _ in range(shelf_levels)] for coord in shelf_coords}
+    # 貨架座標只記錄一次，每次建立佈局時再配置新的層級列表
+    shelf_coords = tuple(map(tuple, np.argwhere(warehouse_matrix == 1).tolist()))
 
-    # 從單一來源設定所有特殊區域
-    for station_list in STATION_LAYOUT.values():
-        for station_info in station_list:
-            station_type = "picking" if "PS" in station_info["id"] else "charge"
-            r, c = station_info["pos"]
-            warehouse_matrix[r, c] = CELL_CODES[station_type]
-            for qr, qc in station_info["queue"]:
-                warehouse_matrix[qr, qc] = CELL_CODES[station_type + "_queue"]
-            er, ec = station_info["exit"]
-            warehouse_matrix[er, ec] = CELL_CODES[station_type + "_exit"]
+    # 從單一來源設定所有特殊區域 (站點、排隊區、出口一次寫入)
+    warehouse_matrix[_STATION_ROWS, _STATION_COLS] = _STATION_CODES
 
+    warehouse_matrix.setflags(write=False)  # 模板只供複製，避免被意外修改
+    return warehouse_matrix, shelf_coords, shelf_levels
 
-    return warehouse_matrix, shelf_levels_dict
+def clear_layout_cache():
+    """清除佈局模板快取，下次呼叫 create_warehouse_layout 時重新建立。"""
+    _layout_template.cache_clear()
 
 def get_station_locations() -> Dict[str, List[Coord]]:
     """
@@ -98,29 +136,25 @@ def get_station_locations() -> Dict[str, List[Coord]]:
     # 直接返回定義好的佈局常數
     return STATION_LAYOUT
 
+@functools.lru_cache(maxsize=8)
+def _cached_rgba(matrix_bytes: bytes, shape: Tuple[int, int], dtype: str) -> np.ndarray:
+    """將佈局矩陣依 _CMAP/_NORM 轉成 uint8 RGBA 影像，相同佈局只轉換一次。"""
+    warehouse_matrix = np.frombuffer(matrix_bytes, dtype=dtype).reshape(shape)
+    rgba = _CMAP(_NORM(warehouse_matrix), bytes=True)
+    rgba.setflags(write=False)
+    return rgba
+
 def plot_warehouse(warehouse_matrix: np.ndarray):
     """
     使用 Matplotlib 將倉儲佈局視覺化。
     """
     num_rows, num_cols = warehouse_matrix.shape
-    
-    # 為所有儲存格類型定義顏色和標籤
-    color_map = {
-        0: ('#FFFFFF', 'Aisle'), 1: ('#A5A5A5', 'Shelf'), 2: ('#FF9800', 'Picking Station'),
-        3: ('#2196F3', 'Charge Station'), 4: ('#ADD8E6', 'Charge Queue'), 5: ('#00008B', 'Charge Exit'),
-        6: ('#FFFACD', 'Picking Queue'), 7: ('#FFA500', 'Picking Exit')
-    }
-    
-    # 根據 color_map 創建 ListedColormap 和圖例
-    colors = [color_map[i][0] for i in sorted(color_map.keys())]
-    labels = [color_map[i][1] for i in sorted(color_map.keys())]
-    patches = [mpatches.Patch(color=colors[i], label=labels[i]) for i in range(len(labels))]
-    cmap = mcolors.ListedColormap(colors)    
-    bounds = np.arange(-0.5, 8.5, 1)
-    norm = mcolors.BoundaryNorm(bounds, cmap.N)
 
+    # 顏色對照、色階與圖例皆為模組常數 (見 COLOR_MAP)；直接顯示快取的 RGBA 影像，不需每次再經色階轉換
     fig, ax = plt.subplots(figsize=(12, 10))
-    ax.imshow(warehouse_matrix, cmap=cmap, norm=norm)
+    rgba = _cached_rgba(warehouse_matrix.tobytes(), warehouse_matrix.shape, warehouse_matrix.dtype.str)
+    # 整數格網不需重取樣：關閉插值與重取樣，走 Agg 的直接貼圖路徑
+    ax.imshow(rgba, interpolation='none', resample=False, aspect='equal', origin='upper')
 
     # 增加網格線和標籤以提高清晰度
     ax.set_xticks(np.arange(num_cols + 1) - 0.5, minor=True)
@@ -130,20 +164,28 @@ def plot_warehouse(warehouse_matrix: np.ndarray):
     ax.set_xticks(np.arange(num_cols))
     ax.set_yticks(np.arange(num_rows))
 
-    plt.legend(handles=patches, bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
+    plt.legend(handles=_LEGEND_PATCHES, bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
     plt.title("Warehouse Layout", fontsize=16)
     plt.show()
 
 
 # --- 新增：供 routing_m.py 使用的輔助函式 ---
 
+# 走道編號的雜湊集合，is_turn_point 以 O(1) 查詢取代列表的線性掃描
+_HORIZONTAL_AISLE_SET = frozenset(HORIZONTAL_AISLES)
+_VERTICAL_AISLE_SET = frozenset(VERTICAL_AISLES)
+
 def is_turn_point(pos: Coord) -> bool:
     """
     檢查一個座標是否為主幹道與次幹道的交叉點 (轉彎點)。
     """
     r, c = pos
     # 轉彎點是水平和垂直走道的交集
-    return r in HORIZONTAL_AISLES and c in VERTICAL_AISLES
+    return r in _HORIZONTAL_AISLE_SET and c in _VERTICAL_AISLE_SET
+
+# 所有轉彎點 (水平與垂直走道的交叉點)，依 (水平走道, 垂直走道) 順序排列，匯入時建立一次
+_TURN_POINTS = np.array([(hr, vc) for hr in HORIZONTAL_AISLES for vc in VERTICAL_AISLES],
+                        dtype=np.int16).reshape(-1, 2)
 
 def find_nearest_turn_point(pos: Coord, direction: str = 'any') -> Coord:
     """
@@ -153,23 +195,51 @@ def find_nearest_turn_point(pos: Coord, direction: str = 'any') -> Coord:
     :return: 最近的轉彎點座標。
     """
     r, c = pos
-    
-    # 產生所有可能的轉彎點
-    all_turn_points = [(hr, vc) for hr in HORIZONTAL_AISLES for vc in VERTICAL_AISLES]
-    
-    if not all_turn_points:
-        return pos # 如果沒有定義轉彎點，返回原位
+    return _nearest_turn_point(int(r), int(c), direction)
 
-    # 根據方向篩選
+@functools.lru_cache(maxsize=4096)
+def _nearest_turn_point(r: int, c: int, direction: str) -> Coord:
+    """find_nearest_turn_point 的快取本體；佈局固定，同一座標與方向只計算一次。"""
+    if not len(_TURN_POINTS):
+        return (r, c) # 如果沒有定義轉彎點，返回原位
+
+    # 根據方向篩選；沒有符合方向的轉彎點時改用全部
+    candidates = _TURN_POINTS
     if direction == 'up':
-        candidate_points = [tp for tp in all_turn_points if tp[0] < r]
+        candidates = _TURN_POINTS[_TURN_POINTS[:, 0] < r]
     elif direction == 'down':
-        candidate_points = [tp for tp in all_turn_points if tp[0] > r]
-    else: # 'any'
-        candidate_points = all_turn_points
+        candidates = _TURN_POINTS[_TURN_POINTS[:, 0] > r]
+    if not len(candidates):
+        candidates = _TURN_POINTS
+
+    # 找到曼哈頓距離最小的點 (距離相同時取排列較前者)
+    dist = np.abs(candidates[:, 0] - r) + np.abs(candidates[:, 1] - c)
+    return tuple(candidates[int(np.argmin(dist))].tolist())
+
+def find_nearest_turn_points(positions, direction: str = 'any') -> np.ndarray:
+    """
+    find_nearest_turn_point 的批次版本，一次處理多個座標。
+    :param positions: 形狀 (N, 2) 的座標陣列 (或座標列表)。
+    :param direction: 'any', 'up', or 'down'，意義與單點版本相同。
+    :return: 形狀 (N, 2) 的最近轉彎點陣列，逐列結果與單點版本一致。
+    """
+    pos = np.asarray(positions, dtype=np.int32).reshape(-1, 2)
+    tp = _TURN_POINTS.astype(np.int32)
+    if not len(tp):
+        return pos.copy() # 如果沒有定義轉彎點，返回原位
 
-    # 找到曼哈頓距離最小的點
-    return min(candidate_points or all_turn_points, key=lambda p: abs(p[0] - r) + abs(p[1] - c))
+    # (N, 轉彎點數) 的曼哈頓距離矩陣
+    dist = np.abs(pos[:, None, 0] - tp[None, :, 0]) + np.abs(pos[:, None, 1] - tp[None, :, 1])
+    if direction in ('up', 'down'):
+        if direction == 'up':
+            allowed = tp[None, :, 0] < pos[:, None, 0]
+        else:
+            allowed = tp[None, :, 0] > pos[:, None, 0]
+        # 沒有符合方向的轉彎點時，該列改用全部轉彎點
+        allowed |= ~allowed.any(axis=1, keepdims=True)
+        dist = np.where(allowed, dist, np.iinfo(np.int32).max)
+    # argmin 取第一個最小值，距離相同時與單點版本同樣取排列較前者
+    return tp[dist.argmin(axis=1)]
 
 if __name__ == '__main__':
     # 這個區塊只在直接執行此腳本時運行。